@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+License filtering on a synthetic repos payload: a has_license scan per
+call, as public_repos() used to do, against license_index.
+
+    python3 -m bench_client [repos]
+"""
+
+import random
+import sys
+import time
+from typing import Dict, List
+from unittest.mock import patch
+
+from client import GithubOrgClient
+
+LICENSES = ["mit", "apache-2.0", "gpl-3.0", "bsd-3-clause", None]
+QUERIES = ["apache-2.0", "mit", "gpl-3.0"]
+
+
+def make_payload(repos: int) -> List[Dict]:
+    """repos records with licenses spread over LICENSES."""
+    rng = random.Random(0)
+    payload = []
+    for n in range(repos):
+        key = rng.choice(LICENSES)
+        payload.append({
+            "name": f"repo-{n}",
+            "license": {"key": key} if key else None,
+        })
+    return payload
+
+
+def scan(payload: List[Dict]) -> None:
+    """One pass over every record per license query."""
+    for key in QUERIES:
+        [repo.get("name") for repo in payload
+         if GithubOrgClient.has_license(repo, key)]
+
+
+def client_for(payload: List[Dict]) -> GithubOrgClient:
+    """A client whose single fetch returns payload."""
+    client = GithubOrgClient("bench")
+    with patch.object(GithubOrgClient, "iter_repos",
+                      return_value=iter(payload)):
+        client.repos_payload
+    return client
+
+
+def queries(client: GithubOrgClient) -> None:
+    """Every license query from license_index."""
+    for key in QUERIES:
+        client.public_repos(key)
+
+
+def cold(payload: List[Dict]) -> None:
+    """The queries on a fresh client, including the index build."""
+    queries(client_for(payload))
+
+
+def timed(func, arg, repeat: int = 5) -> float:
+    """Best of repeat runs, in seconds."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(arg)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(repos: int = 100000) -> None:
+    payload = make_payload(repos)
+    warm = client_for(payload)
+    warm.license_index
+    print(f"{repos} repos, {len(QUERIES)} license queries")
+    for name, func, arg in (("has_license scan", scan, payload),
+                            ("license_index cold", cold, payload),
+                            ("license_index warm", queries, warm)):
+        print(f"{name:18} {timed(func, arg) * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Nested map access: access_nested_map against a getter from compile_path,
+for one map and for extract_path over many.
+
+    python3 -m bench_utils [maps]
+"""
+
+import sys
+import timeit
+
+from utils import access_nested_map, compile_path, extract_path
+
+PATH = ("a", "b", "c")
+
+
+def main(maps: int = 1000) -> None:
+    nested_map = {"a": {"b": {"c": 1}}}
+    nested_maps = [{"a": {"b": {"c": n}}} for n in range(maps)]
+    getter = compile_path(PATH)
+    benches = [
+        ("access_nested_map", "one map",
+         lambda: access_nested_map(nested_map, PATH)),
+        ("compile_path getter", "one map",
+         lambda: getter(nested_map)),
+        ("access_nested_map", f"{maps} maps",
+         lambda: [access_nested_map(m, PATH) for m in nested_maps]),
+        ("extract_path", f"{maps} maps",
+         lambda: extract_path(nested_maps, PATH)),
+    ]
+    for name, over, func in benches:
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=5, number=number)) / number
+        print(f"{name:20} {over:10} {best * 1e6:10.3f} us")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -3,8 +3,15 @@
 Client module for interacting with GitHub organization data.
 """
 
-from typing import List, Dict, Optional
-from utils import get_json, memoize
+import asyncio
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Iterable, Iterator, List, Dict, NamedTuple, Optional, Tuple, Union,
+)
+from utils import get_json, iter_json_pages, memoize
+
+DEFAULT_MAX_CONCURRENCY = 10
 
 
 class GithubOrgClient:
@@ -18,37 +25,139 @@ class GithubOrgClient:
         """Initialize client with organization name."""
         self.org_name = org_name
 
+    @property
     @memoize
     def org(self) -> Dict:
         """Fetch organization information."""
         return get_json(self.ORG_URL.format(self.org_name))
 
     @property
-  @property
-def org(self):
-    """
-    Retrieve organization information from the GitHub API.
+    def _public_repos_url(self) -> str:
+        """URL of the organization's public repositories."""
+        return self.org["repos_url"]
 
-    Returns:
-        dict: A dictionary containing details about the organization.
-    """
-    return get_json(f"https://api.github.com/orgs/{self.org_name}")
+    def iter_repos(self, prefetch: bool = False) -> Iterator[Dict]:
+        """
+        Lazily yield repository records, following Link: rel="next"
+        across every page. With prefetch, the next page is requested
+        while the current one is consumed.
+        """
+        for page in iter_json_pages(self._public_repos_url, prefetch=prefetch):
+            yield from page
+
+    def iter_public_repos(self, license: Optional[str] = None,
+                          prefetch: bool = False) -> Iterator[str]:
+        """
+        Lazily yield public repository names. Optionally filter by license.
+        """
+        for repo in self.iter_repos(prefetch=prefetch):
+            if license is None or self.has_license(repo, license):
+                yield repo.get("name")
 
-    def public_repos(self, license: Optional[str] = None) -> List[str]:
+    @property
+    @memoize
+    def repos_payload(self) -> List[Dict]:
+        """Every public repository record, across all pages."""
+        return list(self.iter_repos())
+
+    @property
+    @memoize
+    def license_index(self) -> Dict[str, List[Tuple[int, str]]]:
         """
-        Get list of public repositories. Optionally filter by license.
+        License key -> [(position, repo name)] in payload order, built in
+        one pass over repos_payload.
+        """
+        index: Dict[str, List[Tuple[int, str]]] = {}
+        for position, repo in enumerate(self.repos_payload):
+            license_info = repo.get("license")
+            if license_info and license_info.get("key"):
+                index.setdefault(license_info["key"], []).append(
+                    (position, repo.get("name"))
+                )
+        return index
+
+    def public_repos(self,
+                     license: Optional[Union[str, Iterable[str]]] = None
+                     ) -> List[str]:
+        """
+        Get list of public repositories. Optionally filter by one license
+        key or any of several, served from license_index.
         """
-        repos = get_json(self._public_repos_url)
         if license is None:
-            return [repo.get("name") for repo in repos]
-        return [
-            repo.get("name")
-            for repo in repos
-            if self.has_license(repo, license)
-        ]
+            return [repo.get("name") for repo in self.repos_payload]
+        if isinstance(license, str):
+            return [name for _, name in self.license_index.get(license, [])]
+        matches = [self.license_index.get(key, []) for key in set(license)]
+        return [name for _, name in heapq.merge(*matches)]
 
     @staticmethod
     def has_license(repo: Dict, license_key: str) -> bool:
         """Check if a repository has a specific license."""
         license_info = repo.get("license")
         return bool(license_info and license_info.get("key") == license_key)
+
+
+class OrgResult(NamedTuple):
+    """Outcome of fetching one organization in a batch."""
+    client: GithubOrgClient
+    org: Optional[Dict]
+    repos: Optional[List[str]]
+    error: Optional[Exception]
+
+
+def _clients_for(org_names: Iterable[str],
+                 clients: Optional[Dict[str, GithubOrgClient]]
+                 ) -> Dict[str, GithubOrgClient]:
+    """
+    One client per distinct org name, reusing (and recording) clients in
+    `clients` so memoized org payloads are shared across batches.
+    """
+    org_names = list(org_names)
+    clients = {} if clients is None else clients
+    for name in org_names:
+        if name not in clients:
+            clients[name] = GithubOrgClient(name)
+    return {name: clients[name] for name in org_names}
+
+
+def _fetch_org(client: GithubOrgClient) -> OrgResult:
+    """Fetch one org's metadata and repos, capturing any failure."""
+    try:
+        return OrgResult(client, client.org, client.public_repos(), None)
+    except Exception as exc:
+        return OrgResult(client, None, None, exc)
+
+
+async def afetch_orgs(org_names: Iterable[str],
+                      max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                      clients: Optional[Dict[str, GithubOrgClient]] = None
+                      ) -> Dict[str, OrgResult]:
+    """
+    Fetch metadata and public repos for many orgs concurrently, with at
+    most max_concurrency orgs in flight. A failing org is reported in its
+    OrgResult.error without affecting the others.
+    """
+    batch = _clients_for(org_names, clients)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def fetch(client: GithubOrgClient) -> OrgResult:
+        async with semaphore:
+            return await loop.run_in_executor(None, _fetch_org, client)
+
+    results = await asyncio.gather(*(fetch(c) for c in batch.values()))
+    return dict(zip(batch, results))
+
+
+def fetch_orgs(org_names: Iterable[str],
+               max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+               clients: Optional[Dict[str, GithubOrgClient]] = None
+               ) -> Dict[str, OrgResult]:
+    """
+    Thread-pool equivalent of afetch_orgs for callers without an event
+    loop (or already inside one).
+    """
+    batch = _clients_for(org_names, clients)
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        results = list(executor.map(_fetch_org, batch.values()))
+    return dict(zip(batch, results))
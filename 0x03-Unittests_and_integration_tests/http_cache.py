@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+On-disk HTTP cache for JSON GET requests.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+
+def parse_cache_control(header: Optional[str]) -> Dict[str, Optional[str]]:
+    """
+    Parse a Cache-Control header into a {directive: value} dict.
+    """
+    directives: Dict[str, Optional[str]] = {}
+    for part in (header or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+class HTTPCache:
+    """
+    Cache of JSON responses keyed by URL, stored one file per entry.
+
+    Fresh entries (within Cache-Control max-age) are served without a
+    request; stale ones are revalidated with If-None-Match and
+    If-Modified-Since, and a 304 reuses the stored body. Entries are
+    written atomically so several processes can share a directory, and
+    the least recently used files are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, directory: str,
+                 max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        """Initialize the cache, creating directory if needed."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = {
+            "hits": 0, "misses": 0, "revalidated": 0,
+            "stores": 0, "evictions": 0,
+        }
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def get_json(self, session: requests.Session, url: str,
+                 timeout: float) -> Any:
+        """
+        Return the JSON payload for url, using the cache where allowed.
+        """
+        return self.get_page(session, url, timeout)[0]
+
+    def get_page(self, session: requests.Session, url: str,
+                 timeout: float) -> Tuple[Any, Optional[str]]:
+        """
+        Return (payload, rel="next" URL) for url, using the cache where
+        allowed.
+        """
+        entry = self._load(url)
+        now = time.time()
+        if entry is not None and entry["expires"] > now:
+            self._count("hits")
+            self._touch(url)
+            return entry["body"], entry.get("next")
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        response = session.get(url, headers=headers, timeout=timeout)
+
+        if response.status_code == 304 and entry is not None:
+            self._count("revalidated")
+            entry["expires"] = self._expires(response, now)
+            self._store(url, entry)
+            return entry["body"], entry.get("next")
+
+        self._count("misses")
+        body = response.json()
+        next_url = response.links.get("next", {}).get("url")
+        cache_control = parse_cache_control(
+            response.headers.get("Cache-Control"))
+        if response.status_code == 200 and "no-store" not in cache_control:
+            self._store(url, {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "expires": self._expires(response, now),
+                "next": next_url,
+                "body": body,
+            })
+        return body, next_url
+
+    def clear(self) -> None:
+        """Remove every entry from the cache directory."""
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                self._remove(os.path.join(self.directory, name))
+
+    @staticmethod
+    def _expires(response: requests.Response, now: float) -> float:
+        """Expiry time from Cache-Control max-age; 0 means revalidate."""
+        directives = parse_cache_control(response.headers.get("Cache-Control"))
+        if "no-cache" in directives:
+            return 0
+        try:
+            return now + int(directives.get("max-age") or 0)
+        except ValueError:
+            return 0
+
+    def _path(self, url: str) -> str:
+        """File holding the entry for url."""
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _load(self, url: str) -> Optional[Dict]:
+        """Read the entry for url, or None if missing or unreadable."""
+        try:
+            with open(self._path(url), encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def _touch(self, url: str) -> None:
+        """Mark the entry as recently used for LRU eviction."""
+        try:
+            os.utime(self._path(url))
+        except OSError:
+            pass
+
+    def _store(self, url: str, entry: Dict) -> None:
+        """Atomically write entry, then evict down to max_bytes."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            json.dump(entry, tmp_file)
+        os.replace(tmp_path, self._path(url))
+        self._count("stores")
+        self._evict(keep=self._path(url))
+
+    def _evict(self, keep: str) -> None:
+        """Delete least recently used entries while over max_bytes."""
+        entries: list = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if not item.name.endswith(".json"):
+                    continue
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            if self._remove(path):
+                self._count("evictions")
+            total -= size
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        """Delete path, tolerating another process having done so."""
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _count(self, stat: str) -> None:
+        """Increment a statistics counter."""
+        with self._lock:
+            self.stats[stat] += 1
@@ -12,10 +12,16 @@ Each test ensures that API calls, responses, and filtering logic
 in GithubOrgClient work as expected.
 """
 
+import asyncio
+import json
+import threading
+import time
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, PropertyMock
 from parameterized import parameterized, parameterized_class
-from client import GithubOrgClient
+import utils
+from client import GithubOrgClient, afetch_orgs, fetch_orgs
 
 
 # Fixtures embedded directly
@@ -51,6 +57,25 @@ class TestGithubOrgClient(unittest.TestCase):
         mock_get_json.assert_called_once_with(expected_url)
         self.assertEqual(result, test_payload)
 
+    @patch('client.get_json')
+    def test_org_single_flight(self, mock_get_json):
+        """Test concurrent first accesses of org trigger one fetch"""
+        def slow_fetch(url):
+            time.sleep(0.05)
+            return {"login": "google"}
+        mock_get_json.side_effect = slow_fetch
+
+        client = GithubOrgClient("google")
+        threads = [
+            threading.Thread(target=lambda: client.org) for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        mock_get_json.assert_called_once()
+
     def test_public_repos_url(self):
         """Test _public_repos_url returns repos_url from org"""
         with patch(
@@ -63,10 +88,10 @@ class TestGithubOrgClient(unittest.TestCase):
 
             self.assertEqual(result, ORG_PAYLOAD["repos_url"])
 
-    @patch('client.get_json')
+    @patch('utils.get_json_page')
     def test_public_repos(self, mock_get_json):
         """Test public_repos returns correct list of repo names"""
-        mock_get_json.return_value = REPOS_PAYLOAD
+        mock_get_json.return_value = (REPOS_PAYLOAD, None)
 
         with patch(
             'client.GithubOrgClient._public_repos_url',
@@ -81,6 +106,70 @@ class TestGithubOrgClient(unittest.TestCase):
             mock_url.assert_called_once()
             mock_get_json.assert_called_once()
 
+    @patch('utils.get_json_page')
+    def test_public_repos_license_index(self, mock_get_page):
+        """Test license queries share one fetch and keep payload order"""
+        mock_get_page.return_value = ([
+            {"name": "a", "license": {"key": "mit"}},
+            {"name": "b", "license": {"key": "apache-2.0"}},
+            {"name": "c", "license": None},
+            {"name": "d", "license": {"key": "mit"}},
+        ], None)
+
+        with patch(
+            'client.GithubOrgClient._public_repos_url',
+            new_callable=PropertyMock, return_value="page1"
+        ):
+            client = GithubOrgClient("testorg")
+            self.assertEqual(client.public_repos(license="mit"), ["a", "d"])
+            self.assertEqual(client.public_repos(license="gpl"), [])
+            self.assertEqual(
+                client.public_repos(license=["apache-2.0", "mit"]),
+                ["a", "b", "d"],
+            )
+            self.assertEqual(client.public_repos(), ["a", "b", "c", "d"])
+
+        mock_get_page.assert_called_once()
+
+    @parameterized.expand([
+        (False,),
+        (True,),
+    ])
+    @patch('utils.get_json_page')
+    def test_public_repos_follows_pages(self, prefetch, mock_get_page):
+        """Test repos are gathered across every rel="next" page"""
+        mock_get_page.side_effect = lambda url: {
+            "page1": ([{"name": "repo1"}], "page2"),
+            "page2": ([{"name": "repo2"}], "page3"),
+            "page3": ([{"name": "repo3"}], None),
+        }[url]
+
+        with patch(
+            'client.GithubOrgClient._public_repos_url',
+            new_callable=PropertyMock, return_value="page1"
+        ):
+            client = GithubOrgClient("testorg")
+            names = list(client.iter_public_repos(prefetch=prefetch))
+
+        self.assertEqual(names, ["repo1", "repo2", "repo3"])
+        self.assertEqual(mock_get_page.call_count, 3)
+
+    @patch('utils.get_json_page')
+    def test_iter_repos_is_lazy(self, mock_get_page):
+        """Test later pages are not fetched until they are consumed"""
+        mock_get_page.side_effect = lambda url: (
+            [{"name": url}], "page2" if url == "page1" else None
+        )
+
+        with patch(
+            'client.GithubOrgClient._public_repos_url',
+            new_callable=PropertyMock, return_value="page1"
+        ):
+            repos = GithubOrgClient("testorg").iter_repos()
+            self.assertEqual(next(repos), {"name": "page1"})
+
+        mock_get_page.assert_called_once_with("page1")
+
     @parameterized.expand([
         ({"license": {"key": "my_license"}}, "my_license", True),
         ({"license": {"key": "other_license"}}, "my_license", False),
@@ -93,7 +182,11 @@ class TestGithubOrgClient(unittest.TestCase):
 
 
 class MockResponse:
-    """Mocked response for requests.get().json()"""
+    """Mocked response for Session.get().json()"""
+    status_code = 200
+    headers = {}
+    links = {}
+
     def __init__(self, json_data):
         self._json_data = json_data
 
@@ -101,7 +194,7 @@ class MockResponse:
         return self._json_data
 
 
- @parameterized_class([
+@parameterized_class([
     {
         "org_payload": ORG_PAYLOAD,
         "repos_payload": REPOS_PAYLOAD,
@@ -114,11 +207,11 @@ class TestIntegrationGithubOrgClient(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        """Start patcher for requests.get with fixture responses"""
-        cls.get_patcher = patch('requests.get')
+        """Start patcher for HTTP GETs with fixture responses"""
+        cls.get_patcher = patch('requests.Session.get')
         mock_get = cls.get_patcher.start()
 
-        def side_effect(url):
+        def side_effect(url, **kwargs):
             if url == "https://api.github.com/orgs/testorg":
                 return MockResponse(cls.org_payload)
             if url == cls.org_payload.get("repos_url"):
@@ -146,5 +239,95 @@ class TestIntegrationGithubOrgClient(unittest.TestCase):
         )
 
 
+class OrgStubHandler(BaseHTTPRequestHandler):
+    """Serves /orgs/<name> and /orgs/<name>/repos; 'broken' has no repos"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+            server.hits.append(self.path)
+        time.sleep(0.02)
+        parts = self.path.strip("/").split("/")
+        if parts[-1] == "repos":
+            payload = [{"name": f"{parts[1]}-repo"}]
+        elif parts[1] == "broken":
+            payload = {"message": "Not Found"}
+        else:
+            payload = {"repos_url": f"{server.base}/orgs/{parts[1]}/repos"}
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with server.lock:
+            server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestFetchOrgs(unittest.TestCase):
+    """Tests for the concurrent multi-org batch API"""
+
+    ORGS = [f"org{i}" for i in range(12)] + ["broken"]
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a local stub GitHub and point the client at it"""
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), OrgStubHandler)
+        cls.server.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url_patcher = patch.object(
+            GithubOrgClient, "ORG_URL", cls.server.base + "/orgs/{}"
+        )
+        cls.url_patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub server"""
+        cls.url_patcher.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.in_flight = 0
+        self.server.peak = 0
+        self.server.hits = []
+        utils.configure_session(pool_size=4)
+
+    def check_results(self, results):
+        self.assertEqual(list(results), self.ORGS)
+        self.assertEqual(results["org3"].repos, ["org3-repo"])
+        self.assertIsNone(results["org3"].error)
+        self.assertIsInstance(results["broken"].error, KeyError)
+        self.assertIsNone(results["broken"].repos)
+
+    def test_afetch_orgs(self):
+        """Test asyncio batch isolates errors and bounds concurrency"""
+        results = asyncio.run(afetch_orgs(self.ORGS, max_concurrency=4))
+        self.check_results(results)
+        self.assertLessEqual(self.server.peak, 4)
+        self.assertGreater(self.server.peak, 1)
+
+    def test_fetch_orgs(self):
+        """Test thread-pool batch isolates errors and bounds concurrency"""
+        results = fetch_orgs(self.ORGS, max_concurrency=4)
+        self.check_results(results)
+        self.assertLessEqual(self.server.peak, 4)
+        self.assertGreater(self.server.peak, 1)
+
+    def test_clients_shared_across_batches(self):
+        """Test memoized org payloads are reused by a later batch"""
+        clients = {}
+        fetch_orgs(["org1"], clients=clients)
+        fetch_orgs(["org1"], clients=clients)
+        self.assertEqual(self.server.hits.count("/orgs/org1"), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
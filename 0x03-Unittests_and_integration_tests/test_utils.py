@@ -3,10 +3,17 @@
 Unit tests for utils module.
 """
 
+import tempfile
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, Mock
 from parameterized import parameterized
-from utils import access_nested_map, get_json, memoize
+import utils
+from utils import (
+    access_nested_map, access_nested_paths, compile_path, extract_path,
+    get_json, memoize,
+)
 
 
 class TestAccessNestedMap(unittest.TestCase):
@@ -31,6 +38,55 @@ class TestAccessNestedMap(unittest.TestCase):
             access_nested_map(nested_map, path)
 
 
+class TestCompilePath(unittest.TestCase):
+    """Tests for compile_path and its batch helpers."""
+
+    @parameterized.expand([
+        ({"a": 1}, ()),
+        ({"a": 1}, ("a",)),
+        ({"a": {"b": 2}}, ("a", "b")),
+        ({"a": {"b": {"c": 3}}}, ("a", "b", "c")),
+        ({"a": {"b": {"c": {"d": 4}}}}, ("a", "b", "c", "d")),
+        ({"a": [5, 6]}, ("a", 1)),
+    ])
+    def test_matches_access_nested_map(self, nested_map, path):
+        """Compiled getters agree with access_nested_map."""
+        self.assertEqual(
+            compile_path(path)(nested_map),
+            access_nested_map(nested_map, path),
+        )
+
+    @parameterized.expand([
+        ({}, ("a",), "a"),
+        ({"a": 1}, ("a", "b"), "b"),
+        ({"a": {"b": {}}}, ("a", "b", "c", "d"), "c"),
+    ])
+    def test_raises_same_key_error(self, nested_map, path, missing):
+        """Missing keys raise KeyError naming the missing key."""
+        with self.assertRaises(KeyError) as ctx:
+            compile_path(path)(nested_map)
+        self.assertEqual(ctx.exception.args, (missing,))
+
+    def test_default(self):
+        """A default replaces the KeyError."""
+        self.assertIsNone(compile_path(("a", "b"), default=None)({"a": 1}))
+
+    def test_access_nested_paths(self):
+        """Several paths are read from one map."""
+        nested_map = {"a": {"b": 2}, "c": 3}
+        self.assertEqual(
+            access_nested_paths(nested_map, [("a", "b"), ("c",), ("x",)], 0),
+            [2, 3, 0],
+        )
+
+    def test_extract_path(self):
+        """One path is read from many maps."""
+        maps = [{"a": {"b": i}} for i in range(3)] + [{}]
+        self.assertEqual(
+            extract_path(maps, ("a", "b"), default=-1), [0, 1, 2, -1]
+        )
+
+
 class TestGetJson(unittest.TestCase):
     """Tests for get_json function."""
 
@@ -38,13 +94,165 @@ class TestGetJson(unittest.TestCase):
         ("http://example.com", {"payload": True}),
         ("http://holberton.io", {"payload": False}),
     ])
-    @patch('utils.requests.get')
-    def test_get_json(self, url, payload, mock_get):
+    @patch('utils.get_session')
+    def test_get_json(self, url, payload, mock_get_session):
         """Test get_json returns expected payload."""
+        mock_get = mock_get_session.return_value.get
         mock_get.return_value = Mock(json=lambda: payload)
         result = get_json(url)
         self.assertEqual(result, payload)
-        mock_get.assert_called_once_with(url)
+        mock_get.assert_called_once_with(url, timeout=utils.DEFAULT_TIMEOUT)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Keep-alive JSON handler that records each client port it serves."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.client_ports.append(self.client_address[1])
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGetJsonSession(unittest.TestCase):
+    """Tests for the pooled session behind get_json."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a local stub HTTP server."""
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.server.client_ports = []
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub server and drop the shared session."""
+        cls.server.shutdown()
+        cls.server.server_close()
+        utils.configure_session()
+
+    def setUp(self):
+        self.server.client_ports.clear()
+        utils.configure_session(pool_size=2, timeout=5)
+
+    def test_connection_reused(self):
+        """Sequential calls share one TCP connection."""
+        for _ in range(5):
+            self.assertEqual(get_json(self.url), {"ok": True})
+        self.assertEqual(len(set(self.server.client_ports)), 1)
+
+    def test_get_session_is_shared(self):
+        """get_session returns the same session from every thread."""
+        sessions = []
+        threads = [
+            threading.Thread(
+                target=lambda: sessions.append(utils.get_session()))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(s) for s in sessions}), 1)
+
+
+class CachingStubHandler(BaseHTTPRequestHandler):
+    """JSON handler with an ETag that answers conditional GETs with 304."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.send_header("Cache-Control", self.server.cache_control)
+            self.end_headers()
+            return
+        body = ('{"path": "%s"}' % self.path).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v1"')
+        self.send_header("Cache-Control", self.server.cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHTTPCache(unittest.TestCase):
+    """Tests for the on-disk HTTP cache behind get_json."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a local stub HTTP server."""
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), CachingStubHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/org"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub server and disable the cache."""
+        cls.server.shutdown()
+        cls.server.server_close()
+        utils.configure_cache(None)
+
+    def setUp(self):
+        self.server.requests = []
+        self.server.cache_control = "max-age=60"
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = utils.configure_cache(self.directory.name)
+
+    def test_fresh_entry_served_without_request(self):
+        """Within max-age the second call never reaches the server."""
+        self.assertEqual(get_json(self.url), {"path": "/org"})
+        self.assertEqual(get_json(self.url), {"path": "/org"})
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.cache.stats["misses"], 1)
+        self.assertEqual(self.cache.stats["hits"], 1)
+
+    def test_stale_entry_revalidated_with_etag(self):
+        """A stale entry sends If-None-Match and reuses the body on 304."""
+        self.server.cache_control = "max-age=0"
+        get_json(self.url)
+        self.assertEqual(get_json(self.url), {"path": "/org"})
+        self.assertEqual(self.server.requests, [None, '"v1"'])
+        self.assertEqual(self.cache.stats["revalidated"], 1)
+
+    def test_entries_persist_across_instances(self):
+        """A new cache on the same directory sees earlier entries."""
+        get_json(self.url)
+        cache = utils.configure_cache(self.directory.name)
+        get_json(self.url)
+        self.assertEqual(cache.stats["hits"], 1)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_least_recently_used_evicted(self):
+        """Exceeding max_bytes removes the oldest entries first."""
+        cache = utils.configure_cache(self.directory.name, max_bytes=1)
+        get_json(self.url + "/a")
+        get_json(self.url + "/b")
+        self.assertEqual(cache.stats["evictions"], 1)
+        get_json(self.url + "/b")
+        self.assertEqual(cache.stats["hits"], 1)
+
+    def test_no_store_not_cached(self):
+        """Responses marked no-store are never written."""
+        self.server.cache_control = "no-store"
+        get_json(self.url)
+        get_json(self.url)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.cache.stats["stores"], 0)
 
 
 class TestMemoize(unittest.TestCase):
@@ -68,3 +276,119 @@ class TestMemoize(unittest.TestCase):
             self.assertEqual(obj.a_property(), 42)
             self.assertEqual(obj.a_property(), 42)
             mock_method.assert_called_once()
+
+    def test_memoize_arguments_and_invalidate(self):
+        """Results are cached per argument tuple and can be dropped."""
+
+        class TestClass:
+            """Test class with an argument-taking memoized method."""
+
+            calls = 0
+
+            @memoize
+            def double(self, value, scale=2):
+                TestClass.calls += 1
+                return value * scale
+
+        obj = TestClass()
+        self.assertEqual(obj.double(2), 4)
+        self.assertEqual(obj.double(2), 4)
+        self.assertEqual(obj.double(2, scale=3), 6)
+        self.assertEqual(TestClass.calls, 2)
+        TestClass.double.invalidate(obj, 2)
+        obj.double(2)
+        self.assertEqual(TestClass.calls, 3)
+        self.assertEqual(
+            TestClass.double.cache_info(),
+            {"hits": 1, "misses": 3, "evictions": 0},
+        )
+        with self.assertRaises(TypeError):
+            obj.double([1])
+
+    def test_memoize_ttl(self):
+        """Entries are recomputed once their ttl has passed."""
+
+        class TestClass:
+            """Test class with an expiring memoized method."""
+
+            @memoize(ttl=10)
+            def value(self):
+                return object()
+
+        obj = TestClass()
+        with patch("utils.time.monotonic", return_value=100):
+            first = obj.value()
+            self.assertIs(obj.value(), first)
+        with patch("utils.time.monotonic", return_value=111):
+            self.assertIsNot(obj.value(), first)
+
+    def test_memoize_maxsize_evicts_least_recently_used(self):
+        """Beyond maxsize the least recently used entry is dropped."""
+
+        class TestClass:
+            """Test class with a bounded memoized method."""
+
+            @memoize(maxsize=2)
+            def square(self, value):
+                return value * value
+
+        obj = TestClass()
+        obj.square(1)
+        obj.square(2)
+        obj.square(1)
+        obj.square(3)
+        self.assertEqual(TestClass.square.cache_info()["evictions"], 1)
+        obj.square(1)
+        self.assertEqual(TestClass.square.cache_info()["misses"], 3)
+
+    def test_memoize_single_flight(self):
+        """Concurrent callers share one in-flight computation."""
+        started = threading.Event()
+        release = threading.Event()
+
+        class TestClass:
+            """Test class with a slow memoized method."""
+
+            calls = 0
+
+            @memoize
+            def slow(self):
+                TestClass.calls += 1
+                started.set()
+                release.wait(5)
+                return 42
+
+        obj = TestClass()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(obj.slow()))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [42] * 8)
+        self.assertEqual(TestClass.calls, 1)
+
+    def test_memoize_does_not_cache_errors(self):
+        """A raising call is retried on the next access."""
+
+        class TestClass:
+            """Test class whose memoized method fails once."""
+
+            calls = 0
+
+            @memoize
+            def flaky(self):
+                TestClass.calls += 1
+                if TestClass.calls == 1:
+                    raise ValueError("boom")
+                return "ok"
+
+        obj = TestClass()
+        with self.assertRaises(ValueError):
+            obj.flaky()
+        self.assertEqual(obj.flaky(), "ok")
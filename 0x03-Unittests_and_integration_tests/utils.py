@@ -3,8 +3,32 @@
 Utility functions for nested map access, JSON fetching, and memoization.
 """
 
-from typing import Mapping, Any, Sequence, Dict
+import functools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    Mapping, Any, Sequence, Dict, Callable, Hashable, Iterable, Iterator,
+    List, Optional, Tuple,
+)
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from http_cache import HTTPCache, DEFAULT_MAX_BYTES
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.3
+
+_session: Optional[requests.Session] = None
+_session_timeout: float = DEFAULT_TIMEOUT
+_session_lock = threading.Lock()
+_http_cache: Optional[HTTPCache] = None
+
+
+_MISSING = object()
 
 
 def access_nested_map(nested_map: Mapping, path: Sequence) -> Any:
@@ -12,27 +36,312 @@ def access_nested_map(nested_map: Mapping, path: Sequence) -> Any:
     Access a nested object in nested_map with a sequence of keys.
     """
     for key in path:
-        nested_map = nested_map[key]
+        try:
+            nested_map = nested_map[key]
+        except TypeError:
+            # Walked into a leaf value that cannot be indexed by key
+            raise KeyError(key) from None
     return nested_map
 
 
+_LOOKUP_ERRORS = (KeyError, TypeError, IndexError)
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_lookup(path: Tuple) -> Callable[[Mapping], Any]:
+    """
+    Build a getter for path with the common short depths unrolled. On a
+    miss it retries through access_nested_map to raise the same error.
+    """
+    if not path:
+        return lambda nested_map: nested_map
+    if len(path) == 1:
+        first, = path
+
+        def lookup(nested_map: Mapping) -> Any:
+            try:
+                return nested_map[first]
+            except _LOOKUP_ERRORS:
+                return access_nested_map(nested_map, path)
+    elif len(path) == 2:
+        first, second = path
+
+        def lookup(nested_map: Mapping) -> Any:
+            try:
+                return nested_map[first][second]
+            except _LOOKUP_ERRORS:
+                return access_nested_map(nested_map, path)
+    elif len(path) == 3:
+        first, second, third = path
+
+        def lookup(nested_map: Mapping) -> Any:
+            try:
+                return nested_map[first][second][third]
+            except _LOOKUP_ERRORS:
+                return access_nested_map(nested_map, path)
+    else:
+        return functools.partial(access_nested_map, path=path)
+    return lookup
+
+
+def compile_path(path: Sequence,
+                 default: Any = _MISSING) -> Callable[[Mapping], Any]:
+    """
+    Compile path once into a getter equivalent to access_nested_map.
+    If default is given it is returned instead of raising KeyError.
+    """
+    lookup = _compile_lookup(tuple(path))
+    if default is _MISSING:
+        return lookup
+
+    def accessor(nested_map: Mapping) -> Any:
+        try:
+            return lookup(nested_map)
+        except (KeyError, IndexError):
+            return default
+    return accessor
+
+
+def access_nested_paths(nested_map: Mapping, paths: Iterable[Sequence],
+                        default: Any = _MISSING) -> List[Any]:
+    """
+    Access several paths against one nested map.
+    """
+    return [compile_path(path, default)(nested_map) for path in paths]
+
+
+def extract_path(nested_maps: Iterable[Mapping], path: Sequence,
+                 default: Any = _MISSING) -> List[Any]:
+    """
+    Access the same path in each of many nested maps.
+    """
+    return list(map(compile_path(path, default), nested_maps))
+
+
+def _build_session(pool_size: int, retries: int,
+                   backoff_factor: float) -> requests.Session:
+    """
+    Build a session whose adapter keeps up to pool_size connections alive
+    per host and retries idempotent GETs on connection errors and 429/5xx.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def configure_session(pool_size: int = DEFAULT_POOL_SIZE,
+                      timeout: float = DEFAULT_TIMEOUT,
+                      retries: int = DEFAULT_RETRIES,
+                      backoff_factor: float = DEFAULT_BACKOFF_FACTOR
+                      ) -> requests.Session:
+    """
+    Replace the shared session used by get_json with a new pooled one.
+    """
+    global _session, _session_timeout
+    session = _build_session(pool_size, retries, backoff_factor)
+    with _session_lock:
+        old, _session, _session_timeout = _session, session, timeout
+    if old is not None:
+        old.close()
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide pooled session, creating it on first use.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session(
+                    DEFAULT_POOL_SIZE, DEFAULT_RETRIES, DEFAULT_BACKOFF_FACTOR
+                )
+    return _session
+
+
+def configure_cache(directory: Optional[str],
+                    max_bytes: int = DEFAULT_MAX_BYTES
+                    ) -> Optional[HTTPCache]:
+    """
+    Enable the on-disk HTTP cache behind get_json, or disable it with None.
+    """
+    global _http_cache
+    _http_cache = HTTPCache(directory, max_bytes) if directory else None
+    return _http_cache
+
+
+def get_cache() -> Optional[HTTPCache]:
+    """
+    Return the HTTP cache used by get_json, if one is configured.
+    """
+    return _http_cache
+
+
 def get_json(url: str) -> Dict:
     """
-    Get JSON from the provided URL.
+    Get JSON from the provided URL over the shared pooled session,
+    through the HTTP cache when one is configured.
     """
-    response = requests.get(url)
+    if _http_cache is not None:
+        return _http_cache.get_json(get_session(), url, _session_timeout)
+    response = get_session().get(url, timeout=_session_timeout)
     return response.json()
 
 
-def memoize(method):
+def get_json_page(url: str) -> Tuple[Any, Optional[str]]:
+    """
+    Get one page of JSON and the URL of the next page from its
+    Link: rel="next" header, or None on the last page.
+    """
+    if _http_cache is not None:
+        return _http_cache.get_page(get_session(), url, _session_timeout)
+    response = get_session().get(url, timeout=_session_timeout)
+    return response.json(), response.links.get("next", {}).get("url")
+
+
+def iter_json_pages(url: str, prefetch: bool = False) -> Iterator[Any]:
+    """
+    Lazily yield each page of a paginated JSON resource. With prefetch,
+    the next page is fetched in the background while the caller works
+    through the current one.
+    """
+    if not prefetch:
+        while url:
+            page, url = get_json_page(url)
+            yield page
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(get_json_page, url)
+        while pending is not None:
+            page, next_url = pending.result()
+            pending = None
+            if next_url:
+                pending = executor.submit(get_json_page, next_url)
+            yield page
+
+
+class _MemoStore:
+    """Per-instance memo table: ordered entries plus in-flight calls."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = \
+            OrderedDict()
+        self.pending: Dict[Hashable, Future] = {}
+
+
+def _make_key(args: Tuple, kwargs: Dict) -> Hashable:
+    """
+    Build a cache key from call arguments; raises TypeError if any
+    argument is unhashable.
     """
-    Decorator to cache method output.
+    key = (args, frozenset(kwargs.items())) if kwargs else args
+    hash(key)
+    return key
+
+
+def memoize(method: Optional[Callable] = None, *,
+            ttl: Optional[float] = None,
+            maxsize: Optional[int] = None) -> Callable:
+    """
+    Decorator to cache method output per instance and per arguments.
+
+    Usable bare (@memoize) or configured (@memoize(ttl=60, maxsize=128)).
+    Entries expire after ttl seconds and the least recently used entry is
+    dropped beyond maxsize. Concurrent calls with the same arguments run
+    the method once and share its result. The wrapper exposes
+    invalidate(obj, *args, **kwargs), cache_clear(obj) and cache_info().
     """
-    attr_name = f"_{method.__name__}"
+    if method is None:
+        return lambda fn: memoize(fn, ttl=ttl, maxsize=maxsize)
+
+    attr_name = f"_memoize_{method.__name__}"
+    stats = {"hits": 0, "misses": 0, "evictions": 0}
+    stats_lock = threading.Lock()
+    store_lock = threading.Lock()
+
+    def count(stat: str) -> None:
+        with stats_lock:
+            stats[stat] += 1
+
+    def store_for(obj: Any) -> _MemoStore:
+        store = obj.__dict__.get(attr_name)
+        if store is None:
+            with store_lock:
+                store = obj.__dict__.setdefault(attr_name, _MemoStore())
+        return store
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = _make_key(args, kwargs)
+        store = store_for(self)
+        with store.lock:
+            entry = store.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    store.entries.move_to_end(key)
+                    count("hits")
+                    return value
+                del store.entries[key]
+            future = store.pending.get(key)
+            owner = future is None
+            if owner:
+                future = store.pending[key] = Future()
+
+        if not owner:
+            count("hits")
+            return future.result()
+
+        count("misses")
+        try:
+            value = method(self, *args, **kwargs)
+        except BaseException as exc:
+            with store.lock:
+                del store.pending[key]
+            future.set_exception(exc)
+            raise
+
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with store.lock:
+            del store.pending[key]
+            store.entries[key] = (value, expires)
+            if maxsize is not None and len(store.entries) > maxsize:
+                store.entries.popitem(last=False)
+                count("evictions")
+        future.set_result(value)
+        return value
+
+    def invalidate(obj: Any, *args, **kwargs) -> None:
+        """Drop the cached result for these arguments on obj."""
+        store = store_for(obj)
+        with store.lock:
+            store.entries.pop(_make_key(args, kwargs), None)
+
+    def cache_clear(obj: Any) -> None:
+        """Drop every cached result on obj."""
+        store = store_for(obj)
+        with store.lock:
+            store.entries.clear()
 
-    def wrapper(self):
-        if not hasattr(self, attr_name):
-            setattr(self, attr_name, method(self))
-        return getattr(self, attr_name)
+    def cache_info() -> Dict[str, int]:
+        """Hit, miss and eviction counts across all instances."""
+        with stats_lock:
+            return dict(stats)
 
+    wrapper.invalidate = invalidate
+    wrapper.cache_clear = cache_clear
+    wrapper.cache_info = cache_info
     return wrapper
@@ -0,0 +1,77 @@
+"""
+Per-request overhead of the chats middleware under ASGI: each class run
+natively in async mode against the same class in sync mode, adapted the
+way Django adapts sync-only middleware (sync_to_async around it and
+async_to_sync around the rest of the chain).
+
+    python -m chats.bench_middleware [requests]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        ALLOWED_HOSTS=['*'],
+        REQUEST_LOG_FILE=os.path.join(tempfile.mkdtemp(), 'requests.log'),
+        ACCESS_POLICIES=[{'path': '/chats/', 'methods': ['POST'], 'roles': ['admin']}],
+        RATE_LIMIT_BACKEND='chats.ratelimit.LocalMemoryBackend',
+    )
+
+from asgiref.sync import async_to_sync, sync_to_async  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from .middleware import (  # noqa: E402
+    AccessPolicyMiddleware, OffensiveLanguageMiddleware, RequestLoggingMiddleware,
+)
+
+MIDDLEWARE = [RequestLoggingMiddleware, AccessPolicyMiddleware, OffensiveLanguageMiddleware]
+
+
+class Anonymous:
+    # Already-resolved anonymous user, as AuthenticationMiddleware leaves it
+    # once something has checked it
+    is_authenticated = False
+
+
+async def view(request):
+    return HttpResponse("ok")
+
+
+def native_chain():
+    handler = view
+    for middleware in reversed(MIDDLEWARE):
+        handler = middleware(handler)
+    return handler
+
+
+def adapted_chain():
+    handler = view
+    for middleware in reversed(MIDDLEWARE):
+        handler = sync_to_async(middleware(async_to_sync(handler)), thread_sensitive=True)
+    return handler
+
+
+async def run(handler, requests):
+    factory = RequestFactory()
+    started = time.perf_counter()
+    for _ in range(requests):
+        request = factory.get('/chats/')
+        request.user = Anonymous()
+        await handler(request)
+    return time.perf_counter() - started
+
+
+def main(requests=2000):
+    for name, chain in (('adapted (sync)', adapted_chain), ('native (async)', native_chain)):
+        elapsed = asyncio.run(run(chain(), requests))
+        print(f"{name:16} {elapsed / requests * 1e6:8.1f} us/request")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
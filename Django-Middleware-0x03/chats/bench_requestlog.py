@@ -0,0 +1,56 @@
+"""
+Request-thread cost of one log record: the old logging.FileHandler path
+against AsyncLogWriter.submit().
+
+    python -m chats.bench_requestlog [records]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from .requestlog import AsyncLogWriter
+
+
+def bench_file_handler(path, records):
+    logger = logging.getLogger('bench.requestlog')
+    logger.propagate = False
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    started = time.perf_counter()
+    for n in range(records):
+        logger.info(f"{datetime.now()} - User: Anonymous - Path: /chats/{n}/")
+    elapsed = time.perf_counter() - started
+    logger.removeHandler(handler)
+    handler.close()
+    return elapsed
+
+
+def bench_async_writer(path, records):
+    writer = AsyncLogWriter(path, max_queue=records)
+    started = time.perf_counter()
+    for n in range(records):
+        writer.submit({'time': time.time(), 'user': 'Anonymous', 'method': 'GET',
+                       'path': f'/chats/{n}/', 'status': 200, 'latency_ms': 1.0})
+    elapsed = time.perf_counter() - started
+    writer.close()
+    return elapsed
+
+
+def main(records=100000):
+    directory = tempfile.mkdtemp()
+    for name, bench in (('logging.FileHandler', bench_file_handler),
+                        ('AsyncLogWriter', bench_async_writer)):
+        path = os.path.join(directory, f'{name}.log')
+        elapsed = bench(path, records)
+        print(f"{name:20} {elapsed / records * 1e6:8.2f} us/record on the request thread")
+        os.remove(path)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -1,68 +1,234 @@
-import logging
-from datetime import datetime, timedelta
-from django.http import HttpResponseForbidden
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from django.utils.deprecation import MiddlewareMixin
-from django.core.cache import cache
+from django.utils.functional import LazyObject, empty
+from .policy import load_policies
+from .ratelimit import SlidingWindowLimiter, get_backend, load_rules, rate_limit_headers
+from .requestlog import AsyncLogWriter
 
-# Configure the logger for request logging
-logging.basicConfig(
-    filename='requests.log',
-    level=logging.INFO,
-    format='%(message)s',
-)
+try:
+    from asgiref.sync import iscoroutinefunction
+except ImportError:  # asgiref < 3.6
+    from asyncio import iscoroutinefunction
+
+
+def get_user(request):
+    """Return the authenticated user, or None for anonymous requests."""
+    user = getattr(request, 'user', None)
+    return user if user is not None and user.is_authenticated else None
+
+
+async def aget_user(request):
+    # request.user is a lazy object backed by sync DB queries
+    if hasattr(request, 'auser'):
+        user = await request.auser()
+        return user if user.is_authenticated else None
+    return await sync_to_async(get_user)(request)
+
+
+# loaded_user() result for a request whose user was never loaded
+UNRESOLVED = object()
+
+
+def loaded_user(request):
+    """
+    Like get_user(), but never runs the session and user queries behind
+    Django's lazy request.user: returns UNRESOLVED if nothing in the
+    request has loaded the user yet.
+    """
+    user = getattr(request, 'user', None)
+    if isinstance(user, LazyObject):
+        if user._wrapped is empty:
+            return UNRESOLVED
+        user = user._wrapped
+    return user if user is not None and user.is_authenticated else None
+
+
+class DualModeMiddleware(MiddlewareMixin):
+    """
+    Base for middleware that runs natively under both WSGI and ASGI.
+    Subclasses implement handle() for sync stacks and __acall__() for
+    async ones, so Django never adapts them with a thread hop.
+    """
+    sync_capable = True
+    async_capable = True
 
-class RequestLoggingMiddleware(MiddlewareMixin):
     def __init__(self, get_response):
-        self.get_response = get_response
+        super().__init__(get_response)
+        self.async_mode = iscoroutinefunction(get_response)
 
     def __call__(self, request):
-        user = request.user if request.user.is_authenticated else 'Anonymous'
-        log_message = f"{datetime.now()} - User: {user} - Path: {request.path}"
-        logging.info(log_message)
-        return self.get_response(request)
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        raise NotImplementedError
 
+    async def __acall__(self, request):
+        raise NotImplementedError
 
-class RestrictAccessByTimeMiddleware(MiddlewareMixin):
+
+class RequestLoggingMiddleware(DualModeMiddleware):
+    """
+    Logs one JSON line per request (time, user, method, path, status and
+    latency) to settings.REQUEST_LOG_FILE via a background writer thread.
+    Under ASGI the user is logged only if something already loaded it,
+    and as '-' otherwise.
+    """
     def __init__(self, get_response):
-        self.get_response = get_response
+        super().__init__(get_response)
+        self.writer = AsyncLogWriter(
+            getattr(settings, 'REQUEST_LOG_FILE', 'requests.log'),
+            **getattr(settings, 'REQUEST_LOG_OPTIONS', {})
+        )
 
-    def __call__(self, request):
-        current_hour = datetime.now().hour
-        # Block access before 6PM (18) and after 9PM (21)
-        if request.path.startswith('/chats/') and (current_hour < 18 or current_hour >= 21):
-            return HttpResponseForbidden("Chat is only available between 6PM and 9PM.")
-        return self.get_response(request)
+    def handle(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.log(request, response, get_user(request), started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        # Loading the user here would cost a thread hop per request
+        self.log(request, response, loaded_user(request), started)
+        return response
 
+    def log(self, request, response, user, started):
+        if user is UNRESOLVED:
+            label = '-'
+        else:
+            label = str(user) if user is not None else 'Anonymous'
+        self.writer.submit({
+            'time': time.time(),
+            'user': label,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+        })
 
-class OffensiveLanguageMiddleware(MiddlewareMixin):
+
+class AccessPolicyMiddleware(DualModeMiddleware):
+    """
+    Enforces settings.ACCESS_POLICIES (time windows and roles per path
+    prefix and method) in a single pass. The table is compiled into a
+    prefix trie at startup; the user is only loaded when a matching
+    policy restricts by role.
+    """
     def __init__(self, get_response):
-        self.get_response = get_response
+        super().__init__(get_response)
+        self.policies = load_policies()
 
-    def __call__(self, request):
-        if request.method == 'POST' and request.path.startswith('/chats/'):
-            ip = self.get_client_ip(request)
-            cache_key = f"msg_count_{ip}"
-            count, expires = cache.get(cache_key, (0, datetime.now() + timedelta(minutes=1)))
-            if datetime.now() > expires:
-                count = 0
-                expires = datetime.now() + timedelta(minutes=1)
-            if count >= 5:
-                return HttpResponseForbidden("Rate limit exceeded. Max 5 messages per minute.")
-            cache.set(cache_key, (count + 1, expires), timeout=60)
+    def handle(self, request):
+        matched = self.policies.match(request.path, request.method)
+        if matched:
+            denied = self.check_hours(matched)
+            if denied is None and self.needs_user(matched):
+                denied = self.check_roles(matched, get_user(request))
+            if denied is not None:
+                return denied
         return self.get_response(request)
 
-    def get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        return x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
+    async def __acall__(self, request):
+        matched = self.policies.match(request.path, request.method)
+        if matched:
+            denied = self.check_hours(matched)
+            if denied is None and self.needs_user(matched):
+                denied = self.check_roles(matched, await aget_user(request))
+            if denied is not None:
+                return denied
+        return await self.get_response(request)
+
+    @staticmethod
+    def needs_user(matched):
+        return any(policy.roles is not None for policy in matched)
+
+    @staticmethod
+    def check_hours(matched):
+        for policy in matched:
+            if not policy.within_hours():
+                return HttpResponseForbidden(policy.message)
+        return None
 
+    @staticmethod
+    def check_roles(matched, user):
+        for policy in matched:
+            if not policy.allows_user(user):
+                return HttpResponseForbidden(policy.message)
+        return None
 
-class RolepermissionMiddleware(MiddlewareMixin):
+
+class OffensiveLanguageMiddleware(DualModeMiddleware):
+    """
+    Rate limits requests per settings.RATE_LIMITS (default: 5 chat POSTs per
+    minute per IP) using an atomic sliding-window counter.
+    """
     def __init__(self, get_response):
-        self.get_response = get_response
+        super().__init__(get_response)
+        self.rules = load_rules()
+        self.limiter = SlidingWindowLimiter(get_backend())
 
-    def __call__(self, request):
-        if request.path.startswith('/chats/') and request.method in ['POST', 'PUT', 'DELETE']:
-            user = request.user
-            if not user.is_authenticated or user.role not in ['admin', 'moderator']:
-                return HttpResponseForbidden("Only admins or moderators can perform this action.")
-        return self.get_response(request)
+    def handle(self, request):
+        rules = self.matching_rules(request)
+        if not rules:
+            return self.get_response(request)
+        user = get_user(request) if any(rule.needs_user for _, rule in rules) else None
+        decision = None
+        for key, rule in self.identities(request, rules, user):
+            result = self.limiter.hit(key, rule.rate)
+            if not result.allowed:
+                return self.throttled(result, rule)
+            decision = self.tightest(decision, result)
+        return self.with_headers(self.get_response(request), decision)
+
+    async def __acall__(self, request):
+        rules = self.matching_rules(request)
+        if not rules:
+            return await self.get_response(request)
+        user = await aget_user(request) if any(rule.needs_user for _, rule in rules) else None
+        decision = None
+        for key, rule in self.identities(request, rules, user):
+            result = await self.limiter.ahit(key, rule.rate)
+            if not result.allowed:
+                return self.throttled(result, rule)
+            decision = self.tightest(decision, result)
+        return self.with_headers(await self.get_response(request), decision)
+
+    def matching_rules(self, request):
+        return [(index, rule) for index, rule in enumerate(self.rules) if rule.matches(request)]
+
+    def identities(self, request, rules, user):
+        ip = self.get_client_ip(request)
+        for index, rule in rules:
+            identity = rule.identity(user, ip)
+            if identity is not None:
+                yield f"{index}:{identity}", rule
+
+    @staticmethod
+    def tightest(decision, result):
+        return result if decision is None or result.remaining < decision.remaining else decision
+
+    @staticmethod
+    def throttled(result, rule):
+        response = HttpResponse(
+            "Rate limit exceeded. Max {} requests per {} seconds.".format(
+                result.limit, rule.rate.period),
+            status=429,
+        )
+        return OffensiveLanguageMiddleware.with_headers(response, result)
+
+    @staticmethod
+    def with_headers(response, decision):
+        if decision is not None:
+            for header, value in rate_limit_headers(decision).items():
+                response[header] = value
+        return response
+
+    def get_client_ip(self, request):
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        return x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
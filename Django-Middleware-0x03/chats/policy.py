@@ -0,0 +1,92 @@
+from datetime import datetime, time as dtime
+
+from django.conf import settings
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    from backports.zoneinfo import ZoneInfo
+
+# Used when settings.ACCESS_POLICIES is not defined; mirrors the original
+# time-window and role checks on /chats/
+DEFAULT_ACCESS_POLICIES = [
+    {
+        'path': '/chats/',
+        'hours': ('18:00', '21:00'),
+        'message': "Chat is only available between 6PM and 9PM.",
+    },
+    {
+        'path': '/chats/',
+        'methods': ['POST', 'PUT', 'DELETE'],
+        'roles': ['admin', 'moderator'],
+        'message': "Only admins or moderators can perform this action.",
+    },
+]
+
+
+class Policy:
+    """
+    One row of the access policy table. A request under `path` (and, if
+    given, using one of `methods`) must fall inside the `hours` window,
+    evaluated in `timezone` (server local time if omitted), and/or belong
+    to a user whose role is in `roles`.
+    """
+
+    def __init__(self, path, methods=None, roles=None, hours=None,
+                 timezone=None, message="Access denied."):
+        self.path = path
+        self.methods = frozenset(m.upper() for m in methods) if methods else None
+        self.roles = frozenset(roles) if roles else None
+        self.window = tuple(dtime.fromisoformat(h) for h in hours) if hours else None
+        self.tz = ZoneInfo(timezone) if timezone else None
+        self.message = message
+
+    def applies_to(self, method):
+        return self.methods is None or method in self.methods
+
+    def within_hours(self, now=None):
+        if self.window is None:
+            return True
+        current = (now or datetime.now(self.tz)).time()
+        start, end = self.window
+        if start <= end:
+            return start <= current < end
+        # Window wraps past midnight, e.g. 22:00-06:00
+        return current >= start or current < end
+
+    def allows_user(self, user):
+        return self.roles is None or (user is not None and user.role in self.roles)
+
+
+class PolicyTrie:
+    """
+    Character trie over policy path prefixes. Matching walks the request
+    path once and stops at the first character no prefix continues with,
+    so paths unrelated to any policy cost a dict lookup or two.
+    """
+
+    def __init__(self, policies):
+        self.root = {}
+        for policy in policies:
+            node = self.root
+            for char in policy.path:
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(policy)
+
+    def match(self, path, method):
+        node = self.root
+        matched = [p for p in node.get(None, ()) if p.applies_to(method)]
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            for policy in node.get(None, ()):
+                if policy.applies_to(method):
+                    matched.append(policy)
+        return matched
+
+
+def load_policies():
+    return PolicyTrie(
+        Policy(**row) for row in getattr(settings, 'ACCESS_POLICIES', DEFAULT_ACCESS_POLICIES)
+    )
@@ -0,0 +1,197 @@
+import math
+import threading
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Used when settings.RATE_LIMITS is not defined: 5 chat POSTs per minute per IP
+DEFAULT_RATE_LIMITS = [
+    {'path': '/chats/', 'methods': ['POST'], 'rate': '5/m', 'key': 'ip'},
+]
+
+Rate = namedtuple('Rate', ['limit', 'period'])
+Decision = namedtuple('Decision', ['allowed', 'limit', 'remaining', 'reset', 'retry_after'])
+
+
+def parse_rate(rate):
+    """Parse '5/m', '100/h' or '10/30s' into a Rate(limit, period_seconds)."""
+    count, _, period = rate.partition('/')
+    multiplier, unit = period[:-1], period[-1]
+    return Rate(int(count), int(multiplier or 1) * PERIODS[unit])
+
+
+class BaseBackend:
+    def hit(self, current_key, previous_key, ttl):
+        """Increment current_key and return (current, previous) counts."""
+        raise NotImplementedError
+
+    async def ahit(self, current_key, previous_key, ttl):
+        return await sync_to_async(self.hit)(current_key, previous_key, ttl)
+
+
+class LocalMemoryBackend(BaseBackend):
+    """Per-process counters; atomic across threads, not across workers."""
+
+    max_entries = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def hit(self, current_key, previous_key, ttl):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._counters) >= self.max_entries:
+                self._counters = {k: v for k, v in self._counters.items() if v[1] > now}
+            count, expires = self._counters.get(current_key, (0, now + ttl))
+            if expires <= now:
+                count, expires = 0, now + ttl
+            self._counters[current_key] = (count + 1, expires)
+            previous, previous_expires = self._counters.get(previous_key, (0, now))
+            if previous_expires <= now:
+                previous = 0
+                self._counters.pop(previous_key, None)
+            return count + 1, previous
+
+    async def ahit(self, current_key, previous_key, ttl):
+        # No I/O, so no thread hop needed
+        return self.hit(current_key, previous_key, ttl)
+
+
+class CacheBackend(BaseBackend):
+    """Django cache counters; cache.incr is atomic on redis/memcached/locmem."""
+
+    def __init__(self, cache_backend=None):
+        self.cache = cache_backend or cache
+
+    def hit(self, current_key, previous_key, ttl):
+        # incr first: only the first hit of a window pays for the add()
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            if self.cache.add(current_key, 1, timeout=ttl):
+                current = 1
+            else:
+                # Another request started the window since our incr()
+                current = self.cache.incr(current_key)
+        return current, self.cache.get(previous_key, 0)
+
+    async def ahit(self, current_key, previous_key, ttl):
+        try:
+            current = await self.cache.aincr(current_key)
+        except ValueError:
+            if await self.cache.aadd(current_key, 1, timeout=ttl):
+                current = 1
+            else:
+                current = await self.cache.aincr(current_key)
+        return current, await self.cache.aget(previous_key, 0)
+
+
+class RedisBackend(BaseBackend):
+    """
+    Redis counters in a single round trip (INCR + EXPIRE + GET pipeline).
+    Any client exposing redis-py's pipeline API works, e.g. fakeredis in tests.
+    """
+
+    def __init__(self, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(
+                getattr(settings, 'RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+            )
+        self.client = client
+
+    def hit(self, current_key, previous_key, ttl):
+        pipe = self.client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, ttl)
+        pipe.get(previous_key)
+        current, _, previous = pipe.execute()
+        return int(current), int(previous or 0)
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window counter: the previous fixed window's count is weighted by
+    how much of it still overlaps the sliding window. One atomic increment
+    per request, no read-modify-write race.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def hit(self, key, rate, now=None):
+        now = time.time() if now is None else now
+        current, previous = self.backend.hit(*self._keys(key, rate, now))
+        return self._decide(rate, now, current, previous)
+
+    async def ahit(self, key, rate, now=None):
+        now = time.time() if now is None else now
+        current, previous = await self.backend.ahit(*self._keys(key, rate, now))
+        return self._decide(rate, now, current, previous)
+
+    def _keys(self, key, rate, now):
+        window = int(now // rate.period)
+        return (
+            f"rl:{key}:{rate.period}:{window}",
+            f"rl:{key}:{rate.period}:{window - 1}",
+            rate.period * 2,
+        )
+
+    def _decide(self, rate, now, current, previous):
+        elapsed = (now % rate.period) / rate.period
+        estimate = previous * (1 - elapsed) + current
+        reset = math.ceil(rate.period * (1 - elapsed))
+        allowed = estimate <= rate.limit
+        retry_after = 0 if allowed else reset
+        remaining = max(0, math.floor(rate.limit - estimate))
+        return Decision(allowed, rate.limit, remaining, reset, retry_after)
+
+
+class RateLimitRule:
+    def __init__(self, path, rate, methods=None, key='ip'):
+        self.path = path
+        self.rate = parse_rate(rate)
+        self.methods = frozenset(m.upper() for m in methods) if methods else None
+        self.key = key
+
+    def matches(self, request):
+        return request.path.startswith(self.path) and (
+            self.methods is None or request.method in self.methods
+        )
+
+    @property
+    def needs_user(self):
+        return self.key in ('user', 'user_or_ip')
+
+    def identity(self, user, ip):
+        """Counter identity for this rule; `user` is None when anonymous."""
+        if self.key == 'user' or (self.key == 'user_or_ip' and user is not None):
+            return f"user:{user.pk}" if user is not None else None
+        return f"ip:{ip}"
+
+
+def get_backend():
+    backend = getattr(settings, 'RATE_LIMIT_BACKEND', 'chats.ratelimit.CacheBackend')
+    return import_string(backend)()
+
+
+def load_rules():
+    return [RateLimitRule(**rule) for rule in getattr(settings, 'RATE_LIMITS', DEFAULT_RATE_LIMITS)]
+
+
+def rate_limit_headers(decision):
+    headers = {
+        'X-RateLimit-Limit': str(decision.limit),
+        'X-RateLimit-Remaining': str(decision.remaining),
+        'X-RateLimit-Reset': str(decision.reset),
+    }
+    if not decision.allowed:
+        headers['Retry-After'] = str(decision.retry_after)
+    return headers
@@ -0,0 +1,79 @@
+import atexit
+import json
+import queue
+import threading
+
+DROP = 'drop'
+BLOCK = 'block'
+
+
+class AsyncLogWriter:
+    """
+    Writes JSON lines to a file from a background thread.
+
+    Request threads only enqueue a dict; serialisation and disk I/O happen in
+    batches on the writer thread. When the bounded queue is full, records are
+    either dropped (and counted) or the caller blocks, depending on `policy`.
+    """
+
+    def __init__(self, path, max_queue=10000, batch_size=256,
+                 flush_interval=0.5, policy=DROP):
+        if policy not in (DROP, BLOCK):
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, record):
+        if self._thread is None:
+            self._start()
+        if self.policy == BLOCK:
+            self._queue.put(record)
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name='request-log-writer', daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        with open(self.path, 'a', encoding='utf-8') as log_file:
+            while not (self._stop.is_set() and self._queue.empty()):
+                batch = self._next_batch()
+                if batch:
+                    log_file.write(''.join(json.dumps(r, default=str) + '\n' for r in batch))
+                    log_file.flush()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
@@ -0,0 +1,301 @@
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import skipIf
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from django.utils.functional import SimpleLazyObject
+from .middleware import (
+    AccessPolicyMiddleware, OffensiveLanguageMiddleware, RequestLoggingMiddleware,
+)
+from .policy import Policy, PolicyTrie
+from .ratelimit import (
+    CacheBackend, LocalMemoryBackend, Rate, RedisBackend, SlidingWindowLimiter,
+    parse_rate, rate_limit_headers,
+)
+from .requestlog import BLOCK, AsyncLogWriter
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class CountingCache:
+    """Wraps a cache backend and counts calls, i.e. network round trips."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.cache, name)
+
+        def counted(*args, **kwargs):
+            self.calls.append(name)
+            return method(*args, **kwargs)
+        return counted
+
+
+class RateLimitTests(SimpleTestCase):
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('5/m'), Rate(5, 60))
+        self.assertEqual(parse_rate('100/h'), Rate(100, 3600))
+        self.assertEqual(parse_rate('10/30s'), Rate(10, 30))
+        with self.assertRaises(KeyError):
+            parse_rate('5/w')
+
+    def test_sliding_window_weights_previous_window(self):
+        limiter = SlidingWindowLimiter(LocalMemoryBackend())
+        rate = Rate(10, 60)
+        for _ in range(10):
+            limiter.hit('k', rate, now=30)
+        # Halfway into the next window, half of the previous 10 still count
+        decisions = [limiter.hit('k', rate, now=90) for _ in range(6)]
+        self.assertEqual([d.allowed for d in decisions], [True] * 5 + [False])
+        self.assertEqual(decisions[0].remaining, 4)
+        self.assertEqual(decisions[-1].retry_after, 30)
+        # A full window later the old hits have aged out
+        self.assertTrue(limiter.hit('k', rate, now=181).allowed)
+
+    def test_headers(self):
+        limiter = SlidingWindowLimiter(LocalMemoryBackend())
+        rate = Rate(1, 60)
+        allowed = rate_limit_headers(limiter.hit('k', rate, now=0))
+        self.assertEqual(allowed, {
+            'X-RateLimit-Limit': '1', 'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '60',
+        })
+        denied = rate_limit_headers(limiter.hit('k', rate, now=15))
+        self.assertEqual(denied['Retry-After'], '45')
+
+    def assert_backend_counts(self, backend):
+        self.assertEqual(backend.hit('cur', 'prev', 120), (1, 0))
+        self.assertEqual(backend.hit('cur', 'prev', 120), (2, 0))
+        self.assertEqual(backend.hit('next', 'cur', 120), (1, 2))
+
+    def test_local_memory_backend(self):
+        self.assert_backend_counts(LocalMemoryBackend())
+
+    def test_cache_backend_round_trips(self):
+        cache = CountingCache(LocMemCache('ratelimit-tests', {}))
+        backend = CacheBackend(cache)
+        self.assert_backend_counts(backend)
+        cache.calls.clear()
+        backend.hit('cur', 'prev', 120)
+        # Steady state: one incr plus one get, as with the original tuple scheme
+        self.assertEqual(cache.calls, ['incr', 'get'])
+
+    @skipIf(fakeredis is None, "fakeredis is not installed")
+    def test_redis_backend(self):
+        client = fakeredis.FakeRedis()
+        self.assert_backend_counts(RedisBackend(client))
+        self.assertEqual(client.ttl('cur'), 120)
+
+
+class StalledLogWriter(AsyncLogWriter):
+    """Holds records in the queue until resume() starts the real writer."""
+
+    def _start(self):
+        self._thread = 'stalled'
+
+    def resume(self):
+        self._thread = None
+        AsyncLogWriter._start(self)
+
+
+class AsyncLogWriterTests(SimpleTestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.log')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def lines(self):
+        with open(self.path, encoding='utf-8') as log_file:
+            return [json.loads(line) for line in log_file]
+
+    def test_writes_batches(self):
+        writer = AsyncLogWriter(self.path, batch_size=2, flush_interval=0.01)
+        for n in range(5):
+            writer.submit({'n': n})
+        writer.close()
+        self.assertEqual(self.lines(), [{'n': n} for n in range(5)])
+
+    def test_drop_policy_counts_overflow(self):
+        writer = StalledLogWriter(self.path, max_queue=2, flush_interval=0.01)
+        for n in range(5):
+            writer.submit({'n': n})
+        self.assertEqual(writer.dropped, 3)
+        writer.resume()
+        writer.close()
+        self.assertEqual(self.lines(), [{'n': 0}, {'n': 1}])
+
+    def test_block_policy_waits_for_room(self):
+        writer = StalledLogWriter(self.path, max_queue=1, flush_interval=0.01, policy=BLOCK)
+        writer.submit({'n': 0})
+        blocked = threading.Thread(target=writer.submit, args=({'n': 1},))
+        blocked.start()
+        blocked.join(0.1)
+        self.assertTrue(blocked.is_alive())
+        writer.resume()
+        blocked.join(5)
+        self.assertFalse(blocked.is_alive())
+        writer.close()
+        self.assertEqual(writer.dropped, 0)
+        self.assertEqual(self.lines(), [{'n': 0}, {'n': 1}])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            AsyncLogWriter(self.path, policy='spill')
+
+
+def ok_view(request):
+    return HttpResponse("ok")
+
+
+async def async_ok_view(request):
+    return HttpResponse("ok")
+
+
+class MiddlewareDispatchTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        handle, self.path = tempfile.mkstemp(suffix='.log')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        cache.clear()
+
+    def logged(self, get_response, request):
+        with self.settings(REQUEST_LOG_FILE=self.path):
+            middleware = RequestLoggingMiddleware(get_response)
+        if middleware.async_mode:
+            async def call():
+                return await middleware(request)
+            response = async_to_sync(call)()
+        else:
+            response = middleware(request)
+        middleware.writer.close()
+        with open(self.path, encoding='utf-8') as log_file:
+            return middleware, response, json.loads(log_file.readline())
+
+    def test_sync_stack_runs_handle(self):
+        request = self.factory.get('/chats/')
+        request.user = SimpleLazyObject(AnonymousUser)
+        middleware, response, record = self.logged(ok_view, request)
+        self.assertFalse(middleware.async_mode)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(record['user'], 'Anonymous')
+        self.assertEqual((record['method'], record['path'], record['status']), ('GET', '/chats/', 200))
+
+    def test_async_stack_never_loads_the_user(self):
+        def load_user():
+            raise AssertionError("request.user was loaded")
+
+        request = self.factory.get('/chats/')
+        request.user = SimpleLazyObject(load_user)
+        middleware, response, record = self.logged(async_ok_view, request)
+        self.assertTrue(middleware.async_mode)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(record['user'], '-')
+
+    def test_async_stack_logs_a_loaded_user(self):
+        request = self.factory.get('/chats/')
+        request.user = SimpleLazyObject(AnonymousUser)
+        request.user.is_authenticated  # e.g. a view checked it
+        _, _, record = self.logged(async_ok_view, request)
+        self.assertEqual(record['user'], 'Anonymous')
+
+    def test_rate_limit_in_both_modes(self):
+        rules = [{'methods': ['POST'], 'path': '/chats/', 'rate': '2/m'}]
+        with self.settings(RATE_LIMITS=rules, RATE_LIMIT_BACKEND='chats.ratelimit.LocalMemoryBackend'):
+            sync_middleware = OffensiveLanguageMiddleware(ok_view)
+            async_middleware = OffensiveLanguageMiddleware(async_ok_view)
+
+        async def async_post():
+            return await async_middleware(self.factory.post('/chats/'))
+
+        statuses = [sync_middleware(self.factory.post('/chats/')).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        responses = [async_to_sync(async_post)() for _ in range(3)]
+        self.assertEqual([r.status_code for r in responses], [200, 200, 429])
+        self.assertEqual(responses[0]['X-RateLimit-Remaining'], '1')
+        self.assertIn('Retry-After', responses[2])
+        # Unmatched requests pass straight through without headers
+        self.assertNotIn('X-RateLimit-Limit', sync_middleware(self.factory.get('/chats/')))
+
+
+class PolicyTests(SimpleTestCase):
+
+    def test_trie_matches_every_prefix_and_method(self):
+        chats = Policy('/chats/', message='chats')
+        writes = Policy('/chats/', methods=['post'], message='writes')
+        admin = Policy('/chats/admin/', message='admin')
+        trie = PolicyTrie([chats, writes, admin])
+        self.assertEqual(trie.match('/chats/', 'GET'), [chats])
+        self.assertEqual(trie.match('/chats/', 'POST'), [chats, writes])
+        self.assertEqual(trie.match('/chats/admin/users/', 'GET'), [chats, admin])
+        self.assertEqual(trie.match('/chat', 'GET'), [])
+        self.assertEqual(trie.match('/api/', 'POST'), [])
+
+    def test_root_policy_matches_everything(self):
+        everywhere = Policy('')
+        self.assertEqual(PolicyTrie([everywhere]).match('/anything/', 'GET'), [everywhere])
+
+    def test_hours_window(self):
+        policy = Policy('/chats/', hours=('18:00', '21:00'))
+        self.assertTrue(policy.within_hours(datetime(2024, 1, 1, 18, 0)))
+        self.assertTrue(policy.within_hours(datetime(2024, 1, 1, 20, 59)))
+        self.assertFalse(policy.within_hours(datetime(2024, 1, 1, 21, 0)))
+        self.assertFalse(policy.within_hours(datetime(2024, 1, 1, 9, 0)))
+
+    def test_hours_window_wraps_past_midnight(self):
+        policy = Policy('/chats/', hours=('22:00', '06:00'))
+        self.assertTrue(policy.within_hours(datetime(2024, 1, 1, 23, 30)))
+        self.assertTrue(policy.within_hours(datetime(2024, 1, 1, 0, 0)))
+        self.assertTrue(policy.within_hours(datetime(2024, 1, 1, 5, 59)))
+        self.assertFalse(policy.within_hours(datetime(2024, 1, 1, 6, 0)))
+        self.assertFalse(policy.within_hours(datetime(2024, 1, 1, 12, 0)))
+
+    def test_roles(self):
+        policy = Policy('/chats/', roles=['admin'])
+        self.assertTrue(policy.allows_user(SimpleNamespace(role='admin')))
+        self.assertFalse(policy.allows_user(SimpleNamespace(role='guest')))
+        self.assertFalse(policy.allows_user(None))
+        self.assertTrue(Policy('/chats/').allows_user(None))
+
+    def test_middleware_loads_user_only_for_role_policies(self):
+        def load_user():
+            raise AssertionError("request.user was loaded")
+
+        policies = [{'path': '/chats/', 'methods': ['POST'], 'roles': ['admin'],
+                     'message': "Admins only."}]
+        with self.settings(ACCESS_POLICIES=policies):
+            middleware = AccessPolicyMiddleware(ok_view)
+            async_middleware = AccessPolicyMiddleware(async_ok_view)
+        factory = RequestFactory()
+
+        request = factory.get('/chats/')
+        request.user = SimpleLazyObject(load_user)
+        self.assertEqual(middleware(request).status_code, 200)
+
+        request = factory.post('/chats/')
+        request.user = SimpleNamespace(is_authenticated=True, role='guest')
+        self.assertEqual(middleware(request).status_code, 403)
+
+        async def post(role):
+            request = factory.post('/chats/')
+            request.user = SimpleNamespace(is_authenticated=True, role=role)
+            return await async_middleware(request)
+
+        self.assertEqual(async_to_sync(post)('guest').status_code, 403)
+        self.assertEqual(async_to_sync(post)('admin').status_code, 200)
@@ -0,0 +1,87 @@
+"""
+Peak memory and time of a message list response: the old list plus
+JsonResponse against ConversationView's stream, drained the way a WSGI
+server would. Runs on the test database of the project's settings, which
+it creates and destroys.
+
+    DJANGO_SETTINGS_MODULE=<project>.settings python -m messaging.bench_streaming [messages]
+"""
+import sys
+import time
+import tracemalloc
+
+import django
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.http import JsonResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from .models import Message  # noqa: E402
+from .views import ConversationView  # noqa: E402
+
+
+def seed(messages, batch=10000):
+    sender = User.objects.create(username='bench-sender')
+    receiver = User.objects.create(username='bench-receiver')
+    for start in range(0, messages, batch):
+        Message.objects.bulk_create(
+            Message(sender=sender, receiver=receiver, content=f"Message number {n} " * 4)
+            for n in range(start, min(start + batch, messages))
+        )
+    return receiver
+
+
+def list_response(request):
+    # ConversationView.get before it streamed
+    messages = Message.objects.filter(receiver=request.user)\
+        .select_related('sender')\
+        .only('id', 'sender', 'content', 'timestamp')
+    message_list = [{
+        "id": msg.id,
+        "from": msg.sender.username,
+        "content": msg.content,
+        "timestamp": msg.timestamp
+    } for msg in messages]
+    return JsonResponse({"messages": message_list})
+
+
+def streamed_response(request):
+    return ConversationView.as_view()(request)
+
+
+def drain(view, request):
+    return sum(len(chunk) for chunk in view(request))
+
+
+def measure(view, request):
+    # Timed without tracemalloc, which slows allocation-heavy code several fold
+    started = time.perf_counter()
+    size = drain(view, request)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    drain(view, request)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main(messages=50000):
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        request = RequestFactory().get('/messages/')
+        request.user = seed(messages)
+        print(f"{messages} messages on {connection.vendor}")
+        for name, view in (('list + JsonResponse', list_response),
+                           ('streamed', streamed_response)):
+            size, elapsed, peak = measure(view, request)
+            print(f"{name:20} peak {peak / 2 ** 20:7.1f} MiB  {elapsed:6.2f} s  "
+                  f"{size / 2 ** 20:6.1f} MiB sent")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
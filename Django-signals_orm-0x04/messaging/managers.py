@@ -1,5 +1,140 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Sum
+
 
 class UnreadMessagesManager(models.Manager):
     def unread_for_user(self, user):
         return self.filter(receiver=user, read=False).only('id', 'sender', 'content', 'timestamp')
+
+    def unread_count(self, user):
+        """Total unread messages for user, read from the counter table."""
+        from .models import UnreadCounter
+        total = UnreadCounter.objects.filter(user=user).aggregate(total=Sum('count'))['total']
+        return total or 0
+
+    def unread_counts(self, user):
+        """{sender_id: unread count} for user, read from the counter table."""
+        from .models import UnreadCounter
+        return dict(
+            UnreadCounter.objects.filter(user=user, count__gt=0).values_list('sender_id', 'count')
+        )
+
+    def mark_read(self, user, ids=None, sender=None):
+        """
+        Mark user's unread messages read with one UPDATE, optionally only
+        those in ids and/or from sender, and decrement the counters to
+        match. Returns the number of messages marked.
+
+        The update bypasses save(), so neither per-object queries nor
+        log_message_edit run.
+        """
+        from .models import UnreadCounter
+        unread = self.filter(receiver=user, read=False)
+        if ids is not None:
+            unread = unread.filter(pk__in=ids)
+        if sender is not None:
+            unread = unread.filter(sender=sender)
+
+        with transaction.atomic(using=self.db):
+            # Locking the user's counters serialises concurrent mark-reads
+            list(UnreadCounter.objects.select_for_update().filter(user=user).values_list('pk'))
+            per_sender = list(unread.values('sender_id').annotate(n=Count('pk')).order_by())
+            marked = unread.update(read=True)
+            for row in per_sender:
+                UnreadCounter.objects.bump(user.pk, row['sender_id'], -row['n'])
+        return marked
+
+
+class UnreadCounterManager(models.Manager):
+    def bump(self, user_id, sender_id, delta):
+        """Add delta to the (user, sender) counter, creating it if needed."""
+        if self.filter(user_id=user_id, sender_id=sender_id).update(count=F('count') + delta):
+            return
+        if delta < 0:
+            # Nothing counted yet (or the counter went with its user)
+            return
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(user_id=user_id, sender_id=sender_id, count=delta)
+        except IntegrityError:
+            # Created concurrently since the update above
+            self.filter(user_id=user_id, sender_id=sender_id).update(count=F('count') + delta)
+
+    def rebuild(self, user):
+        """Recompute user's counters from the messages table."""
+        from .models import Message
+        with transaction.atomic(using=self.db):
+            self.filter(user=user).delete()
+            self.bulk_create(
+                self.model(user=user, sender_id=row['sender_id'], count=row['n'])
+                for row in Message.objects.filter(receiver=user, read=False)
+                .values('sender_id').annotate(n=Count('pk')).order_by()
+            )
+
+
+class ThreadManager(models.Manager):
+    """
+    Loads reply threads with one recursive CTE instead of one query per
+    node. Every returned message carries `depth` and `thread_replies`
+    (its direct replies, oldest first), already attached in memory.
+    """
+
+    def thread(self, root_id, max_depth=None):
+        """Return the message root_id with its whole reply tree, or None."""
+        roots = self._load_trees(self.filter(pk=root_id).values('pk'), max_depth)
+        return roots[0] if roots else None
+
+    def threads(self, page=1, per_page=20, max_depth=None, **filters):
+        """
+        Return one page of top-level messages (newest first) with their
+        reply trees, all in a single query.
+        """
+        offset = (page - 1) * per_page
+        roots = self.filter(parent_message__isnull=True, **filters)\
+            .order_by('-timestamp', '-pk').values('pk')[offset:offset + per_page]
+        trees = self._load_trees(roots, max_depth)
+        trees.reverse()  # rows come back oldest first
+        return trees
+
+    def _load_trees(self, roots, max_depth):
+        opts = self.model._meta
+        table = opts.db_table
+        pk = opts.pk.column
+        parent = opts.get_field('parent_message').column
+        timestamp = opts.get_field('timestamp').column
+        roots_sql, roots_params = roots.query.sql_with_params()
+        depth_sql = ""
+        depth_params = []
+        if max_depth is not None:
+            depth_sql = "WHERE thread.depth < %s"
+            depth_params = [max_depth]
+
+        # Depth rides along as a column so the CTE itself enforces max_depth
+        sql = f"""
+            WITH RECURSIVE thread ({pk}, depth) AS (
+                SELECT {pk}, 0 FROM {table} WHERE {pk} IN ({roots_sql})
+                UNION ALL
+                SELECT child.{pk}, thread.depth + 1
+                FROM {table} child JOIN thread ON child.{parent} = thread.{pk}
+                {depth_sql}
+            )
+            SELECT {table}.*, thread.depth
+            FROM {table} JOIN thread ON {table}.{pk} = thread.{pk}
+            ORDER BY {table}.{timestamp}, {table}.{pk}
+        """
+        messages = list(self.raw(sql, [*roots_params, *depth_params]))
+        return self._assemble(messages)
+
+    @staticmethod
+    def _assemble(messages):
+        by_id = {}
+        for message in messages:
+            message.thread_replies = []
+            by_id[message.pk] = message
+        roots = []
+        for message in messages:
+            if message.depth == 0:
+                roots.append(message)
+            else:
+                by_id[message.parent_message_id].thread_replies.append(message)
+        return roots
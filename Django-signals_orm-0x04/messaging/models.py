@@ -1,6 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
-from .managers import UnreadMessagesManager  # ✅ import your custom manager
+from .managers import ThreadManager, UnreadCounterManager, UnreadMessagesManager  # ✅ import your custom manager
 
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
@@ -10,10 +10,23 @@ class Message(models.Model):
     read = models.BooleanField(default=False)
     edited = models.BooleanField(default=False)
     parent_message = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies')
+    # Outbox flag: cleared once the receiver's Notification has been written
+    notification_pending = models.BooleanField(default=True, db_index=True, editable=False)
 
+    objects = ThreadManager()
     # ✅ Custom manager for unread filtering
     unread = UnreadMessagesManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Snapshot for log_message_edit, so edits are detected without a query
+        if 'content' in instance.__dict__:
+            instance._loaded_content = instance.content
+        if 'read' in instance.__dict__:
+            instance._loaded_read = instance.read
+        return instance
+
     def __str__(self):
         return f"{self.sender} → {self.receiver}: {self.content[:30]}"
 
@@ -36,3 +49,18 @@ class MessageHistory(models.Model):
 
     def __str__(self):
         return f"Edit by {self.edited_by} at {self.edited_at}"
+
+
+class UnreadCounter(models.Model):
+    """Unread messages per (receiver, sender), kept in step by the signals."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='unread_counters')
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    count = models.IntegerField(default=0)
+
+    objects = UnreadCounterManager()
+
+    class Meta:
+        unique_together = ('user', 'sender')
+
+    def __str__(self):
+        return f"{self.user} has {self.count} unread from {self.sender}"
@@ -0,0 +1,143 @@
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationQueue:
+    """
+    In-process queue that writes Notification rows off the request path.
+
+    Each new Message is created with notification_pending=True, which makes
+    the messages table itself the durable outbox: workers bulk_create the
+    notifications for a batch and clear the flag in the same transaction,
+    and recover() re-enqueues anything left pending by a crash or restart.
+    A supervisor thread runs recover() at startup and puts batches that
+    failed to write back on the queue every retry_interval seconds.
+    With settings.NOTIFICATION_QUEUE_SYNC the queue is drained inline.
+    """
+
+    def __init__(self, workers=None, batch_size=None, flush_interval=0.2, retry_interval=None):
+        self.workers = workers or getattr(settings, 'NOTIFICATION_WORKERS', 2)
+        self.batch_size = batch_size or getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval or getattr(settings, 'NOTIFICATION_RETRY_INTERVAL', 30)
+        self._queue = queue.Queue()
+        self._failed = queue.Queue()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, message_id, user_id):
+        self._queue.put((message_id, user_id))
+        if getattr(settings, 'NOTIFICATION_QUEUE_SYNC', False):
+            self.drain()
+        elif not self._threads:
+            self.start()
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._run, name=f'notification-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            # Not on the enqueueing request's thread: recovery scans the outbox
+            self._threads.append(
+                threading.Thread(target=self._supervise, name='notification-supervisor', daemon=True)
+            )
+            for thread in self._threads:
+                thread.start()
+
+    def recover(self):
+        from .models import Message
+        pending = Message.objects.filter(notification_pending=True)\
+            .values_list('pk', 'receiver_id').iterator()
+        for item in pending:
+            self._queue.put(item)
+
+    def retry(self):
+        """Put everything that failed to write back on the queue."""
+        while True:
+            try:
+                self._queue.put(self._failed.get_nowait())
+            except queue.Empty:
+                return
+
+    def drain(self):
+        """Write everything currently queued on the calling thread."""
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                return
+            self.write(batch)
+
+    def write(self, batch):
+        from .models import Message, Notification
+        ids = [message_id for message_id, _ in batch]
+        with transaction.atomic():
+            # Skip anything another worker (or recover()) already handled
+            still_pending = set(
+                Message.objects.select_for_update()
+                .filter(pk__in=ids, notification_pending=True)
+                .values_list('pk', flat=True)
+            )
+            seen = set()
+            notifications = []
+            for message_id, user_id in batch:
+                if message_id in still_pending and message_id not in seen:
+                    seen.add(message_id)
+                    notifications.append(Notification(user_id=user_id, message_id=message_id))
+            Notification.objects.bulk_create(notifications)
+            Message.objects.filter(pk__in=seen).update(notification_pending=False)
+
+    def _take(self, block):
+        try:
+            batch = [self._queue.get(block=block, timeout=self.flush_interval if block else None)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take(block=True)
+            if not batch:
+                continue
+            close_old_connections()
+            try:
+                self.write(batch)
+            except Exception:
+                # Rows stay pending in the outbox; the supervisor retries them
+                logger.exception("Failed to write %d notifications", len(batch))
+                for item in batch:
+                    self._failed.put(item)
+            finally:
+                close_old_connections()
+
+    def _supervise(self):
+        recovered = False
+        while True:
+            if not recovered:
+                close_old_connections()
+                try:
+                    self.recover()
+                    recovered = True
+                except Exception:
+                    logger.exception("Failed to recover pending notifications")
+                finally:
+                    close_old_connections()
+            self.retry()
+            time.sleep(self.retry_interval)
+
+
+notification_queue = NotificationQueue()
@@ -0,0 +1,128 @@
+import logging
+import threading
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Message, MessageHistory, Notification, UnreadCounter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _raw_delete(queryset):
+    # Single DELETE ... WHERE statement: no cascade collector, no per-row signals
+    return queryset._raw_delete(queryset.db)
+
+
+def _delete_rows(ids):
+    """Delete these messages and their dependents, but not their replies."""
+    unread = Message.objects.filter(pk__in=ids, read=False)\
+        .values('receiver_id', 'sender_id').annotate(n=Count('pk')).order_by()
+    for row in unread:
+        UnreadCounter.objects.bump(row['receiver_id'], row['sender_id'], -row['n'])
+    _raw_delete(Notification.objects.filter(message_id__in=ids))
+    _raw_delete(MessageHistory.objects.filter(message_id__in=ids))
+    return _raw_delete(Message.objects.filter(pk__in=ids))
+
+
+def _reply_ids(ids, chunk_size):
+    replies = []
+    for start in range(0, len(ids), chunk_size):
+        replies.extend(
+            Message.objects.filter(parent_message_id__in=ids[start:start + chunk_size])
+            .values_list('pk', flat=True)
+        )
+    return replies
+
+
+def _delete_messages(ids, chunk_size):
+    """
+    Delete messages and every reply beneath them, whoever wrote it. The
+    tree is walked one level at a time and deleted deepest level first,
+    at most chunk_size messages per transaction, so a long thread never
+    turns into one large transaction.
+    """
+    levels = [list(ids)]
+    while levels[-1]:
+        levels.append(_reply_ids(levels[-1], chunk_size))
+    deleted = 0
+    for level in reversed(levels):
+        for start in range(0, len(level), chunk_size):
+            chunk = level[start:start + chunk_size]
+            # Replies posted since the walk go first, or the parents can't
+            late = _reply_ids(chunk, chunk_size)
+            if late:
+                deleted += _delete_messages(late, chunk_size)
+            with transaction.atomic():
+                deleted += _delete_rows(chunk)
+    return deleted
+
+
+def _purge_messages(queryset, chunk_size, totals, progress):
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        totals['messages'] += _delete_messages(ids, chunk_size)
+        if progress is not None:
+            progress('messages', totals['messages'])
+
+
+def _purge_in_chunks(queryset, delete_chunk, chunk_size, stage, totals, progress):
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                return
+            totals[stage] += delete_chunk(ids)
+        if progress is not None:
+            progress(stage, totals[stage])
+
+
+def purge_user(user_id, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Delete everything in the messaging app that belongs to a user, in
+    bounded transactions of at most chunk_size rows each, without
+    instantiating models or firing per-object signals.
+
+    Call before user.delete() so Django's cascade collector finds nothing
+    left to load. progress, if given, is called as progress(stage, deleted).
+    Returns the number of rows deleted per stage.
+    """
+    totals = {'messages': 0, 'notifications': 0, 'history': 0}
+    _purge_messages(
+        Message.objects.filter(Q(sender_id=user_id) | Q(receiver_id=user_id)),
+        chunk_size, totals, progress,
+    )
+    _purge_in_chunks(
+        Notification.objects.filter(user_id=user_id),
+        lambda ids: _raw_delete(Notification.objects.filter(pk__in=ids)),
+        chunk_size, 'notifications', totals, progress,
+    )
+    _purge_in_chunks(
+        MessageHistory.objects.filter(edited_by_id=user_id),
+        lambda ids: _raw_delete(MessageHistory.objects.filter(pk__in=ids)),
+        chunk_size, 'history', totals, progress,
+    )
+    return totals
+
+
+def purge_user_in_background(user, chunk_size=DEFAULT_CHUNK_SIZE, progress=None,
+                             delete_user=True):
+    """
+    Run purge_user on a background thread, deleting the user afterwards
+    unless delete_user is False. Returns the started thread.
+    """
+    def run():
+        try:
+            purge_user(user.pk, chunk_size=chunk_size, progress=progress)
+            if delete_user:
+                user.delete()
+        except Exception:
+            logger.exception("Purge of user %s failed", user.pk)
+
+    thread = threading.Thread(target=run, name=f'purge-user-{user.pk}', daemon=True)
+    thread.start()
+    return thread
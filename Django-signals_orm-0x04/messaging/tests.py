@@ -1 +1,347 @@
+import json
+import threading
+from unittest.mock import patch
 
+from django.contrib.auth.models import User
+from django.middleware.csrf import CsrfViewMiddleware
+from django.test import RequestFactory, TestCase, override_settings
+from .models import Message, MessageHistory, Notification, UnreadCounter
+from .notifications import NotificationQueue, notification_queue
+from . import purge
+from .purge import purge_user
+from .views import ConversationView, UnreadMessagesView, delete_user
+
+
+@override_settings(NOTIFICATION_QUEUE_SYNC=True)
+class NotificationQueueTests(TestCase):
+
+    def setUp(self):
+        self.sender = User.objects.create_user(username='alice', password='pass')
+        self.receiver = User.objects.create_user(username='bob', password='pass')
+
+    def send(self, content="hi"):
+        return Message.objects.create(sender=self.sender, receiver=self.receiver, content=content)
+
+    def test_notification_written_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            message = self.send()
+            self.assertFalse(Notification.objects.exists())
+        self.assertTrue(Notification.objects.filter(user=self.receiver, message=message).exists())
+        message.refresh_from_db()
+        self.assertFalse(message.notification_pending)
+
+    def test_batch_write_is_idempotent(self):
+        messages = [self.send(str(i)) for i in range(3)]
+        batch = [(m.pk, self.receiver.pk) for m in messages]
+        with self.assertNumQueries(5):
+            notification_queue.write(batch + batch)
+        notification_queue.write(batch)
+        self.assertEqual(Notification.objects.count(), 3)
+
+    def test_recover_requeues_pending_messages(self):
+        # on_commit callbacks never ran, so these are only in the outbox
+        for i in range(3):
+            self.send(str(i))
+        notification_queue.recover()
+        notification_queue.drain()
+        self.assertEqual(Notification.objects.filter(user=self.receiver).count(), 3)
+        self.assertFalse(Message.objects.filter(notification_pending=True).exists())
+
+    def test_start_recovers_off_the_calling_thread(self):
+        workers = NotificationQueue(workers=1, retry_interval=60)
+        recovered_on = []
+        done = threading.Event()
+        with patch.object(workers, 'recover', side_effect=lambda: (
+                recovered_on.append(threading.get_ident()), done.set())):
+            with self.assertNumQueries(0):
+                workers.start()
+            self.assertTrue(done.wait(5))
+        self.assertNotEqual(recovered_on, [threading.get_ident()])
+
+    def test_failed_batches_are_retried(self):
+        workers = NotificationQueue(workers=1, flush_interval=0.01, retry_interval=0.01)
+        written = []
+        done = threading.Event()
+
+        def write(batch):
+            if not written:
+                written.append(None)
+                raise RuntimeError("database is locked")
+            written.append(batch)
+            done.set()
+
+        with patch.object(workers, 'recover'), patch.object(workers, 'write', side_effect=write), \
+                self.assertLogs('messaging.notifications', 'ERROR'):
+            workers.start()
+            workers._queue.put((1, 2))
+            self.assertTrue(done.wait(5))
+        self.assertEqual(written[1:], [[(1, 2)]])
+
+
+class MessageEditTrackingTests(TestCase):
+
+    def setUp(self):
+        sender = User.objects.create_user(username='carol', password='pass')
+        receiver = User.objects.create_user(username='dave', password='pass')
+        self.message_id = Message.objects.create(
+            sender=sender, receiver=receiver, content="original"
+        ).pk
+        self.message = Message.objects.get(pk=self.message_id)
+
+    def test_marking_read_issues_only_the_update(self):
+        self.message.read = True
+        with self.assertNumQueries(2):  # UPDATE message + its unread counter
+            self.message.save()
+        with self.assertNumQueries(1):
+            self.message.save(update_fields=['read'])
+        self.assertFalse(MessageHistory.objects.exists())
+
+    def test_content_change_logs_history_without_select(self):
+        self.message.content = "edited"
+        with self.assertNumQueries(2):  # UPDATE message + INSERT history
+            self.message.save()
+        history = MessageHistory.objects.get(message_id=self.message_id)
+        self.assertEqual(history.old_content, "original")
+        self.assertTrue(Message.objects.get(pk=self.message_id).edited)
+
+    def test_snapshot_follows_successive_edits(self):
+        for content in ["second", "third"]:
+            self.message.content = content
+            self.message.save()
+        self.assertEqual(
+            list(MessageHistory.objects.order_by('id').values_list('old_content', flat=True)),
+            ["original", "second"],
+        )
+
+    def test_unloaded_instance_falls_back_to_query(self):
+        message = Message(pk=self.message_id, sender_id=self.message.sender_id,
+                          receiver_id=self.message.receiver_id, content="changed",
+                          timestamp=self.message.timestamp)
+        message.save()
+        self.assertEqual(MessageHistory.objects.get().old_content, "original")
+
+
+class PurgeUserTests(TestCase):
+
+    def setUp(self):
+        self.doomed = User.objects.create_user(username='erin', password='pass')
+        self.other = User.objects.create_user(username='frank', password='pass')
+        for i in range(5):
+            sent = Message.objects.create(sender=self.doomed, receiver=self.other, content=str(i))
+            Message.objects.create(sender=self.other, receiver=self.doomed, content="re")
+            # A reply from someone else still cascades with its parent
+            Message.objects.create(sender=self.other, receiver=self.other,
+                                   content="thread", parent_message=sent)
+            Notification.objects.create(user=self.doomed, message=sent)
+            Notification.objects.create(user=self.other, message=sent)
+            MessageHistory.objects.create(message=sent, old_content="old", edited_by=self.doomed)
+        self.kept = Message.objects.create(sender=self.other, receiver=self.other, content="mine")
+
+    def test_purge_removes_everything_in_chunks(self):
+        progress = []
+        totals = purge_user(self.doomed.pk, chunk_size=3,
+                            progress=lambda stage, done: progress.append((stage, done)))
+        self.assertEqual(totals, {'messages': 15, 'notifications': 0, 'history': 0})
+        self.assertEqual(list(Message.objects.all()), [self.kept])
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(MessageHistory.objects.exists())
+        # 10 of the user's own messages in chunks of 3 -> 4 progress reports
+        self.assertEqual(len(progress), 4)
+        self.assertEqual(progress[-1], ('messages', 15))
+
+    def test_reply_trees_deleted_leaves_first_in_bounded_chunks(self):
+        root = Message.objects.create(sender=self.doomed, receiver=self.other, content="root")
+        level = [root]
+        for depth in range(4):
+            level = [
+                Message.objects.create(sender=self.other, receiver=self.other,
+                                       content=f"{depth}", parent_message=parent)
+                for parent in level for _ in range(2)
+            ]
+        parents = dict(Message.objects.values_list('pk', 'parent_message_id'))
+        chunks = []
+        delete_rows = purge._delete_rows
+
+        def record(ids):
+            chunks.append(list(ids))
+            return delete_rows(ids)
+
+        with patch.object(purge, '_delete_rows', record):
+            totals = purge_user(self.doomed.pk, chunk_size=3)
+        self.assertEqual(totals['messages'], 15 + 1 + 2 + 4 + 8 + 16)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), 3)
+        deleted = set()
+        for chunk in chunks:
+            # Nothing is deleted before its replies are gone
+            self.assertFalse(deleted & {parents[pk] for pk in chunk})
+            self.assertFalse({pk for pk, parent in parents.items() if parent in chunk} - deleted)
+            deleted.update(chunk)
+        self.assertEqual(list(Message.objects.all()), [self.kept])
+
+    def test_deleting_user_through_view_purges_first(self):
+        request = RequestFactory().post('/delete-user/')
+        request.user = self.doomed
+        response = delete_user(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(User.objects.filter(pk=self.doomed.pk).exists())
+        self.assertEqual(list(Message.objects.all()), [self.kept])
+
+
+class ThreadTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='gina', password='pass')
+        self.bob = User.objects.create_user(username='hank', password='pass')
+
+    def post(self, content, parent=None):
+        return Message.objects.create(sender=self.alice, receiver=self.bob,
+                                      content=content, parent_message=parent)
+
+    def test_whole_thread_in_one_query(self):
+        root = self.post("root")
+        a = self.post("a", root)
+        b = self.post("b", root)
+        a1 = self.post("a1", a)
+        self.post("a1x", a1)
+        self.post("other root")
+
+        with self.assertNumQueries(1):
+            thread = Message.objects.thread(root.pk)
+            self.assertEqual([r.content for r in thread.thread_replies], ["a", "b"])
+            self.assertEqual(thread.thread_replies[0].thread_replies[0].content, "a1")
+            self.assertEqual(thread.thread_replies[0].thread_replies[0].thread_replies[0].depth, 3)
+
+        limited = Message.objects.thread(root.pk, max_depth=1)
+        self.assertEqual([r.pk for r in limited.thread_replies], [a.pk, b.pk])
+        self.assertEqual(limited.thread_replies[0].thread_replies, [])
+
+    def test_top_level_threads_paginated(self):
+        roots = [self.post(f"root {i}") for i in range(5)]
+        for root in roots:
+            self.post("reply", root)
+
+        with self.assertNumQueries(1):
+            page = Message.objects.threads(page=1, per_page=2)
+            self.assertEqual([t.pk for t in page], [roots[4].pk, roots[3].pk])
+            self.assertTrue(all(len(t.thread_replies) == 1 for t in page))
+        last = Message.objects.threads(page=3, per_page=2)
+        self.assertEqual([t.pk for t in last], [roots[0].pk])
+        self.assertIsNone(Message.objects.thread(-1))
+
+
+class UnreadCounterTests(TestCase):
+
+    def setUp(self):
+        self.reader = User.objects.create_user(username='ivy', password='pass')
+        self.jack = User.objects.create_user(username='jack', password='pass')
+        self.kate = User.objects.create_user(username='kate', password='pass')
+        self.from_jack = [self.send(self.jack) for _ in range(3)]
+        self.from_kate = [self.send(self.kate) for _ in range(2)]
+
+    def send(self, sender):
+        return Message.objects.create(sender=sender, receiver=self.reader, content="hi")
+
+    def test_counts_follow_create_save_and_delete(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(Message.unread.unread_counts(self.reader),
+                             {self.jack.pk: 3, self.kate.pk: 2})
+        message = Message.objects.get(pk=self.from_jack[0].pk)
+        message.read = True
+        message.save()
+        self.from_kate[0].delete()
+        self.assertEqual(Message.unread.unread_count(self.reader), 3)
+
+    def test_bulk_mark_read_is_one_update_without_history(self):
+        # savepoint, lock counters, group, UPDATE, one counter per sender, release
+        with self.assertNumQueries(6):
+            marked = Message.unread.mark_read(self.reader, sender=self.jack)
+        self.assertEqual(marked, 3)
+        self.assertEqual(Message.unread.unread_counts(self.reader), {self.kate.pk: 2})
+        self.assertFalse(MessageHistory.objects.exists())
+
+        marked = Message.unread.mark_read(self.reader, ids=[self.from_kate[1].pk, self.from_jack[0].pk])
+        self.assertEqual(marked, 1)
+        self.assertEqual(Message.unread.unread_count(self.reader), 1)
+
+    def test_purge_keeps_other_counters_consistent(self):
+        purge_user(self.jack.pk)
+        self.assertEqual(Message.unread.unread_counts(self.reader), {self.kate.pk: 2})
+        UnreadCounter.objects.rebuild(self.reader)
+        self.assertEqual(Message.unread.unread_counts(self.reader), {self.kate.pk: 2})
+
+    def test_endpoint_marks_read_and_reports_counts(self):
+        factory = RequestFactory()
+        request = factory.post('/unread/', data={"sender": self.kate.pk},
+                               content_type='application/json')
+        request.user = self.reader
+        response = UnreadMessagesView.as_view()(request)
+        self.assertEqual(json.loads(response.content), {"marked": 2, "unread_count": 3})
+
+        request = factory.get('/unread/', {'counts': 1})
+        request.user = self.reader
+        response = UnreadMessagesView.as_view()(request)
+        self.assertEqual(json.loads(response.content),
+                         {"unread_count": 3, "by_sender": {str(self.jack.pk): 3}})
+
+    def test_endpoint_rejects_malformed_bodies(self):
+        factory = RequestFactory()
+        for body in ('{"ids": ["abc"]}', '{"ids": 5}', '{"ids": [true]}',
+                     '{"sender": "1"}', '[1, 2]', 'not json'):
+            request = factory.post('/unread/', data=body, content_type='application/json')
+            request.user = self.reader
+            response = UnreadMessagesView.as_view()(request)
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(Message.unread.unread_count(self.reader), 5)
+
+    def test_endpoint_is_csrf_protected(self):
+        view = UnreadMessagesView.as_view()
+        request = RequestFactory().post('/unread/', data={"ids": []}, content_type='application/json')
+        request.user = self.reader
+        response = CsrfViewMiddleware(view).process_view(request, view, (), {})
+        self.assertEqual(response.status_code, 403)
+
+
+class StreamingViewTests(TestCase):
+
+    def setUp(self):
+        self.reader = User.objects.create_user(username='lena', password='pass')
+        sender = User.objects.create_user(username='mike', password='pass')
+        self.messages = [
+            Message.objects.create(sender=sender, receiver=self.reader, content=f"m{i}")
+            for i in range(5)
+        ]
+        self.factory = RequestFactory()
+
+    def get(self, view, **params):
+        request = self.factory.get('/', params)
+        request.user = self.reader
+        response = view.as_view()(request)
+        body = b''.join(response.streaming_content).decode() if response.streaming else response.content
+        return response, body
+
+    def test_json_document_keeps_the_old_shape(self):
+        response, body = self.get(ConversationView)
+        self.assertTrue(response.streaming)
+        data = json.loads(body)
+        self.assertEqual([m['content'] for m in data['messages']], [f"m{i}" for i in range(5)])
+        self.assertEqual(set(data['messages'][0]), {'id', 'from', 'content', 'timestamp'})
+        self.assertEqual(data['messages'][0]['from'], 'mike')
+        self.assertIsNone(data['next'])
+
+        data = json.loads(self.get(UnreadMessagesView)[1])
+        self.assertEqual(len(data['unread_messages']), 5)
+
+    def test_limit_and_cursor_page_through(self):
+        first = json.loads(self.get(ConversationView, limit=3)[1])
+        self.assertEqual(len(first['messages']), 3)
+        rest = json.loads(self.get(ConversationView, limit=3, cursor=first['next'])[1])
+        self.assertEqual([m['content'] for m in rest['messages']], ["m3", "m4"])
+        self.assertIsNone(rest['next'])
+        response, _ = self.get(ConversationView, cursor='x')
+        self.assertEqual(response.status_code, 400)
+
+    def test_ndjson(self):
+        response, body = self.get(UnreadMessagesView, format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = body.splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [m.pk for m in self.messages])
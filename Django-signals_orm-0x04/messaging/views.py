@@ -1,13 +1,91 @@
 from django.views.decorators.cache import cache_page
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
 from .models import Message
+from .purge import purge_user
 from django.contrib.auth.models import User
 import json
 
+STREAM_CHUNK_SIZE = 2000  # rows fetched per round trip
+STREAM_BATCH_SIZE = 500  # rows encoded per chunk written to the client
+
+
+def _paginate(request, queryset):
+    """
+    Apply the optional ?cursor= (last id seen) and ?limit= parameters;
+    raises ValueError if either is not an integer.
+    """
+    cursor = int(request.GET['cursor']) if request.GET.get('cursor') else None
+    limit = int(request.GET['limit']) if request.GET.get('limit') else None
+    queryset = queryset.order_by('id')
+    if cursor is not None:
+        queryset = queryset.filter(id__gt=cursor)
+    if limit is not None:
+        queryset = queryset[:max(limit, 0)]
+    return queryset, limit
+
+
+def _encoded_rows(queryset):
+    # values() rows straight off a chunked cursor: no model instances, no full list
+    rows = queryset.values('id', 'sender__username', 'content', 'timestamp')\
+        .iterator(chunk_size=STREAM_CHUNK_SIZE)
+    for row in rows:
+        yield row['id'], json.dumps({
+            "id": row['id'],
+            "from": row['sender__username'],
+            "content": row['content'],
+            "timestamp": row['timestamp'],
+        }, cls=DjangoJSONEncoder)
+
+
+def _ndjson_lines(encoded):
+    batch = []
+    for _, text in encoded:
+        batch.append(text + '\n')
+        if len(batch) == STREAM_BATCH_SIZE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def _json_document(key, encoded, limit):
+    """The same {key: [...]} document JsonResponse built, plus "next"."""
+    yield '{"%s": [' % key
+    count, last, batch, separator = 0, None, [], ''
+    for message_id, text in encoded:
+        count, last = count + 1, message_id
+        batch.append(text)
+        if len(batch) == STREAM_BATCH_SIZE:
+            yield separator + ', '.join(batch)
+            batch, separator = [], ', '
+    if batch:
+        yield separator + ', '.join(batch)
+    # Only a page cut short by ?limit= has a next cursor
+    next_cursor = last if limit and count == limit else None
+    yield '], "next": %s}' % json.dumps(next_cursor)
+
+
+def stream_messages(request, queryset, key):
+    """
+    Stream queryset as {key: [...], "next": cursor}, or as NDJSON (one
+    message per line) with ?format=ndjson or Accept: application/x-ndjson.
+    """
+    try:
+        queryset, limit = _paginate(request, queryset)
+    except ValueError:
+        return JsonResponse({"error": "cursor and limit must be integers"}, status=400)
+    encoded = _encoded_rows(queryset)
+    if request.GET.get('format') == 'ndjson' or \
+            'application/x-ndjson' in request.headers.get('Accept', ''):
+        return StreamingHttpResponse(_ndjson_lines(encoded), content_type='application/x-ndjson')
+    return StreamingHttpResponse(_json_document(key, encoded, limit), content_type='application/json')
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 @method_decorator(cache_page(60), name='dispatch')  # ✅ cache for 60s
 class SendMessageView(View):
@@ -44,30 +122,56 @@ class ConversationView(View):
             .select_related('sender')\
             .only('id', 'sender', 'content', 'timestamp')
 
-        message_list = [{
-            "id": msg.id,
-            "from": msg.sender.username,
-            "content": msg.content,
-            "timestamp": msg.timestamp
-        } for msg in messages]
+        return stream_messages(request, messages, "messages")
+
+
+def _mark_read_args(body):
+    """
+    (ids, sender) from a mark-read body: {"ids": [int, ...]} and/or
+    {"sender": int}, either optional; raises ValueError on anything else.
+    """
+    data = json.loads(body or '{}')
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object.")
+    ids, sender = data.get("ids"), data.get("sender")
+
+    def is_int(value):
+        return isinstance(value, int) and not isinstance(value, bool)
 
-        return JsonResponse({"messages": message_list})
+    if ids is not None and not (isinstance(ids, list) and all(is_int(pk) for pk in ids)):
+        raise ValueError("ids must be a list of integers.")
+    if sender is not None and not is_int(sender):
+        raise ValueError("sender must be an integer.")
+    return ids, sender
 
 
 @method_decorator(login_required, name='dispatch')
 class UnreadMessagesView(View):
     def get(self, request):
+        if request.GET.get('counts'):
+            # Served from the counter table, no scan of the messages
+            by_sender = Message.unread.unread_counts(request.user)
+            return JsonResponse({
+                "unread_count": sum(by_sender.values()),
+                "by_sender": {str(sender_id): n for sender_id, n in by_sender.items()},
+            })
+
         # ✅ Message.unread.unread_for_user + only
         messages = Message.unread.unread_for_user(request.user)
 
-        unread_list = [{
-            "id": msg.id,
-            "from": msg.sender.username,
-            "content": msg.content,
-            "timestamp": msg.timestamp
-        } for msg in messages]
+        return stream_messages(request, messages, "unread_messages")
 
-        return JsonResponse({"unread_messages": unread_list})
+    def post(self, request):
+        # Bulk mark-read: {"ids": [...]} and/or {"sender": id}; empty body marks all
+        try:
+            ids, sender = _mark_read_args(request.body)
+        except ValueError as exc:  # json.JSONDecodeError included
+            return JsonResponse({"error": str(exc)}, status=400)
+        marked = Message.unread.mark_read(request.user, ids=ids, sender=sender)
+        return JsonResponse({
+            "marked": marked,
+            "unread_count": Message.unread.unread_count(request.user),
+        })
 
 
 @csrf_exempt
@@ -75,6 +179,8 @@ class UnreadMessagesView(View):
 def delete_user(request):
     if request.method == 'POST':
         user = request.user
+        # Set-based purge first so the cascade collector has nothing to load
+        purge_user(user.pk)
         user.delete()  # ✅ Required: user.delete()
         return JsonResponse({"message": "User deleted successfully"})
     return JsonResponse({"error": "Invalid request method"}, status=400)
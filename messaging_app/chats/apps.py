@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class ChatsConfig(AppConfig):
+    name = 'chats'
+
+    def ready(self):
+        import chats.signals
+        from chats.search import create_search_index
+        post_migrate.connect(create_search_index, sender=self)
@@ -0,0 +1,74 @@
+"""
+The chats indexes on a seeded throwaway database: each hot query timed
+and EXPLAINed with the indexes, then again after dropping them. The
+conversation list is compared against the MAX(sent_at) aggregate it
+replaced. Runs on the configured database engine's test database, which
+it creates and destroys.
+
+    DJANGO_SETTINGS_MODULE=messaging_app.settings python -m chats.bench_indexes [messages] [conversations]
+"""
+import sys
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from .bench_search import seed, timed
+
+
+def queries(user, other, conversation):
+    from .models import Conversation, Message
+
+    recent = timezone.now() - timedelta(days=7)
+    month = (timezone.now() - timedelta(days=60), timezone.now() - timedelta(days=30))
+    return [
+        # Keyset paging through one conversation
+        ('message page', lambda: Message.objects.filter(conversation=conversation)
+            .order_by('-sent_at', '-message_id')[:50]),
+        # ConversationViewSet's unread count for one conversation
+        ('unread count', lambda: Message.objects.filter(conversation=conversation, sent_at__gt=recent)
+            .exclude(sender=user).values('conversation').annotate(total=Count('*'))),
+        # MessageFilter's sender and date range
+        ('sender range', lambda: Message.objects.filter(sender=other, sent_at__range=month)),
+        ('inbox (aggregate)', lambda: Conversation.objects.filter(participants=user)
+            .annotate(last=Max('messages__sent_at')).order_by(F('last').desc(nulls_last=True))[:20]),
+        ('inbox (column)', lambda: Conversation.objects.filter(participants=user)
+            .order_by(F('last_message_at').desc(nulls_last=True))[:20]),
+    ]
+
+
+def report(label, benches):
+    print(f"\n{label}")
+    for name, query in benches:
+        elapsed = timed(lambda: list(query()))
+        print(f"  {name:18} {elapsed * 1000:8.2f} ms")
+        for line in query().explain().splitlines():
+            print(f"      {line}")
+
+
+def main(messages=200000, conversations=200):
+    from .models import Conversation, Message
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = seed(messages, conversations)
+        # A conversation with an average history (messages / conversations) and its other participant
+        conversation = Conversation.objects.order_by('conversation_id')[0]
+        other = conversation.participants.exclude(pk=user.pk).get()
+        benches = queries(user, other, conversation)
+
+        print(f"{messages} messages in {conversations} conversations on {connection.vendor}")
+        report("with indexes", benches)
+        indexed = [(Message, index) for index in Message._meta.indexes]
+        indexed += [(Conversation, index) for index in Conversation._meta.indexes]
+        with connection.schema_editor() as editor:
+            for model, index in indexed:
+                editor.remove_index(model, index)
+        report(f"without {', '.join(index.name for _, index in indexed)}", benches)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,108 @@
+"""
+Message search on a seeded throwaway database: a LIKE scan against
+search_messages(). Runs on the configured database engine's test
+database, which it creates and destroys.
+
+    DJANGO_SETTINGS_MODULE=messaging_app.settings python -m chats.bench_search [messages]
+"""
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'messaging_app.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+WORDS = ("lunch dinner meeting later tomorrow office call project deadline "
+         "weekend coffee review release budget travel ticket invoice").split()
+# In about one message in a thousand, so neither query stops early
+RARE_WORD = 'zanzibar'
+
+
+def seed(messages, conversations=2000, users=200, batch=10000):
+    from django.db.models import OuterRef, Subquery
+
+    from .models import Conversation, Message, User
+    from .search import rebuild_search_index
+
+    rng = random.Random(0)
+    people = User.objects.bulk_create(
+        User(username=f'bench{n}', email=f'bench{n}@example.com', first_name='B', last_name='M')
+        for n in range(users)
+    )
+    chats = Conversation.objects.bulk_create(Conversation() for _ in range(conversations))
+    Participant = Conversation.participants.through
+    # people[0] searches, and is in every conversation: the worst case for a scan
+    members = {chat.pk: [people[0], rng.choice(people[1:])] for chat in chats}
+    Participant.objects.bulk_create(
+        Participant(conversation_id=chat_id, user_id=person.pk)
+        for chat_id, pair in members.items() for person in pair
+    )
+    seqs = dict.fromkeys(members, 0)
+    # A year of history, one message every few minutes
+    sent_at = timezone.now() - timedelta(days=365)
+    step = timedelta(days=365) / max(messages, 1)
+    for start in range(0, messages, batch):
+        rows = []
+        for _ in range(min(batch, messages - start)):
+            chat = rng.choice(chats)
+            seqs[chat.pk] += 1
+            sent_at += step
+            words = rng.choices(WORDS, k=8)
+            if rng.random() < 0.001:
+                words.append(RARE_WORD)
+            rows.append(Message(
+                sender=rng.choice(members[chat.pk]), conversation=chat, sent_at=sent_at,
+                seq=seqs[chat.pk], changed_seq=seqs[chat.pk], message_body=" ".join(words),
+            ))
+        Message.objects.bulk_create(rows)
+    # bulk_create skips save() and the indexing signals
+    Conversation.objects.update(last_message_at=Subquery(
+        Message.objects.filter(conversation=OuterRef('pk')).order_by('-sent_at').values('sent_at')[:1]
+    ))
+    rebuild_search_index()
+    return people[0]
+
+
+def timed(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(messages=200000):
+    from .models import Message
+    from .search import search_messages
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = seed(messages)
+
+        def like():
+            # Newest first: LIKE has no relevance to order by
+            list(Message.objects.filter(conversation__participants=user,
+                                        message_body__icontains=RARE_WORD)
+                 .order_by('-sent_at')[:20])
+
+        def fts():
+            search_messages(user, RARE_WORD)
+
+        print(f"{messages} messages on {connection.vendor}")
+        print(f"LIKE scan        {timed(like) * 1000:8.1f} ms")
+        print(f"search_messages  {timed(fts) * 1000:8.1f} ms")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
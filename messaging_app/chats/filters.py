@@ -3,8 +3,8 @@ from .models import Message
 
 class MessageFilter(django_filters.FilterSet):
     sender = django_filters.CharFilter(field_name="sender__username", lookup_expr='icontains')
-    created_at__gte = django_filters.DateTimeFilter(field_name="created_at", lookup_expr='gte')
-    created_at__lte = django_filters.DateTimeFilter(field_name="created_at", lookup_expr='lte')
+    created_at__gte = django_filters.DateTimeFilter(field_name="sent_at", lookup_expr='gte')
+    created_at__lte = django_filters.DateTimeFilter(field_name="sent_at", lookup_expr='lte')
 
     class Meta:
         model = Message
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Conversation
+
+Participant = Conversation.participants.through
+
+CACHE_KEY = 'chats:members:{}'
+
+
+def _cache_ttl():
+    # Seconds to share membership sets across requests; 0 disables the cache
+    return getattr(settings, 'CHATS_MEMBERSHIP_CACHE_TTL', 0)
+
+
+def _members(conversation_id, ttl):
+    key = CACHE_KEY.format(conversation_id)
+    members = cache.get(key)
+    if members is None:
+        members = frozenset(
+            Participant.objects.filter(conversation_id=conversation_id)
+            .values_list('user_id', flat=True)
+        )
+        cache.set(key, members, ttl)
+    return members
+
+
+def is_participant(request, conversation_id):
+    """
+    Whether request.user belongs to conversation_id.
+
+    Answered by one EXISTS on the participants table (covered by its
+    unique (conversation, user) index) and memoized on the request, so a
+    permission check and the view asking again cost a single query. With
+    settings.CHATS_MEMBERSHIP_CACHE_TTL set, whole membership sets are
+    shared through the cache instead and dropped when participants change.
+    """
+    user = request.user
+    if not user or not user.is_authenticated:
+        return False
+
+    # DRF's Request proxies the HttpRequest; memoize on the one both share
+    memo = getattr(request, '_request', request).__dict__.setdefault('_chats_membership', {})
+    key = str(conversation_id)
+    if key not in memo:
+        ttl = _cache_ttl()
+        if ttl:
+            memo[key] = user.pk in _members(conversation_id, ttl)
+        else:
+            memo[key] = Participant.objects.filter(
+                conversation_id=conversation_id, user_id=user.pk
+            ).exists()
+    return memo[key]
+
+
+def invalidate(conversation_ids):
+    """Drop the shared membership sets of these conversations."""
+    cache.delete_many([CACHE_KEY.format(pk) for pk in conversation_ids])
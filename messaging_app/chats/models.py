@@ -1,6 +1,15 @@
 import uuid
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Case, F, Q, Value, When, sql
+from django.utils import timezone
+
+
+def _can_update_returning(connection):
+    # UPDATE ... RETURNING: Postgres, and SQLite from 3.35
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
 
 
 class User(AbstractUser):
@@ -27,10 +36,49 @@ class User(AbstractUser):
         return f"{self.username} ({self.email})"
 
 
+class ConversationManager(models.Manager):
+    def next_seq(self, conversation_id, **updates):
+        """
+        Claim the conversation's next sequence number, applying updates
+        (as QuerySet.update() would) to the row in the same statement.
+        Call inside a transaction: the UPDATE's row lock holds off
+        concurrent writers until it commits, so numbers are never handed
+        out twice. Returns None if the conversation does not exist.
+        """
+        conversations = self.filter(pk=conversation_id)
+        updates['last_seq'] = F('last_seq') + 1
+        connection = connections[conversations.db]
+        if not _can_update_returning(connection):
+            conversations.update(**updates)
+            return conversations.values_list('last_seq', flat=True).first()
+        query = conversations.query.chain(sql.UpdateQuery)
+        query.add_update_values(updates)
+        update_sql, params = query.get_compiler(conversations.db).as_sql()
+        column = connection.ops.quote_name(self.model._meta.get_field('last_seq').column)
+        with connection.cursor() as cursor:
+            cursor.execute(f"{update_sql} RETURNING {column}", params)
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+
 class Conversation(models.Model):
     conversation_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     participants = models.ManyToManyField(User, related_name="conversations")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by Message.save() and chats.signals so conversation lists
+    # never scan messages
+    last_message = models.ForeignKey(
+        'Message', null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='+', editable=False
+    )
+    # Not indexed: lists are driven by the user's participant rows and sort
+    # their few conversations in memory, and it changes with every message
+    last_message_at = models.DateTimeField(null=True, blank=True, editable=False)
+    message_count = models.PositiveIntegerField(default=0, editable=False)
+    # Bumped by every insert, edit and delete of one of its messages
+    last_seq = models.PositiveBigIntegerField(default=0, editable=False)
+
+    objects = ConversationManager()
 
     def __str__(self):
         return f"Conversation {self.conversation_id}"
@@ -41,7 +89,129 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     conversation = models.ForeignKey(Conversation, related_name="messages", on_delete=models.CASCADE)
     message_body = models.TextField(null=False, blank=False)
-    sent_at = models.DateTimeField(auto_now_add=True)
+    # Set by save() on insert, like auto_now_add, but before the conversation
+    # row is updated so last_message_at matches it exactly
+    sent_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Position in the conversation, fixed on insert
+    seq = models.PositiveBigIntegerField(null=True, editable=False)
+    # Conversation sequence number of the latest insert or edit, for delta sync
+    changed_seq = models.PositiveBigIntegerField(null=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'seq'], name='message_convo_seq_unique'),
+        ]
+        indexes = [
+            # Delta sync: a conversation's changes after a sequence number
+            models.Index(fields=['conversation', 'changed_seq'], name='message_convo_changed_idx'),
+            # Keyset pagination and unread counts within one conversation
+            models.Index(fields=['conversation', 'sent_at', 'message_id'], name='message_convo_sent_idx'),
+            # MessageFilter date ranges and per-sender history
+            models.Index(fields=['sender', 'sent_at'], name='message_sender_sent_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Like Django's own multi-table saves: no savepoint, an error marks
+        # an outer transaction for rollback
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            if self._state.adding:
+                self.sent_at = timezone.now()
+                # Claims the seq and records the activity in one write of the
+                # conversation row; the deferred FK allows last_message to
+                # point at this not yet inserted row
+                seq = Conversation.objects.next_seq(self.conversation_id, **self._activity_updates())
+                if self.seq is None:
+                    self.seq = seq
+            else:
+                seq = Conversation.objects.next_seq(self.conversation_id)
+            self.changed_seq = seq
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'changed_seq'}
+            super().save(*args, **kwargs)
+
+    def _activity_updates(self):
+        # Never moves last_message backwards if a newer message won a race
+        newer = Q(last_message_at__isnull=True) | Q(last_message_at__lte=self.sent_at)
+        return {
+            'message_count': F('message_count') + 1,
+            'last_message': Case(
+                When(newer, then=Value(self.pk, output_field=models.UUIDField())),
+                default=F('last_message'),
+            ),
+            'last_message_at': Case(
+                When(newer, then=Value(self.sent_at)),
+                default=F('last_message_at'),
+            ),
+        }
 
     def __str__(self):
         return f"Message from {self.sender.username} in Conversation {self.conversation.conversation_id}"
+
+
+class ConversationReadState(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="read_states")
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name="read_states")
+    last_read_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'conversation')
+
+    def __str__(self):
+        return f"{self.user.username} read {self.conversation.conversation_id} at {self.last_read_at}"
+
+
+class MessageTombstone(models.Model):
+    """Left behind by a deleted message so delta sync can report it."""
+    # No database constraint: tombstones are written while a conversation's
+    # messages are cascade-deleted, and are dropped with it in chats.signals
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        related_name='+'
+    )
+    message_id = models.UUIDField()
+    seq = models.PositiveBigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'seq'], name='tombstone_convo_seq_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.message_id} at {self.conversation_id}#{self.seq}"
+
+
+class SyncState(models.Model):
+    """
+    The server side of one delta sync token: how far its client has
+    synced each conversation, as SyncCursor rows. Never changed once
+    written, so a client can retry a sync with the same token.
+    """
+    token = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    # The state this one was advanced from
+    parent = models.ForeignKey('self', null=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Expiring a user's abandoned tokens
+            models.Index(fields=['user', 'created_at'], name='syncstate_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Sync token {self.token} of {self.user.username}"
+
+
+class SyncCursor(models.Model):
+    state = models.ForeignKey(SyncState, on_delete=models.CASCADE, related_name='cursors')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='sync_cursors')
+    # Last sequence number the client has seen in the conversation
+    seq = models.PositiveBigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['state', 'conversation'], name='synccursor_state_convo_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.state_id} at {self.conversation_id}#{self.seq}"
@@ -1,5 +1,15 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+import uuid
+from collections import namedtuple
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class MessagePagination(PageNumberPagination):
@@ -14,3 +24,127 @@ class MessagePagination(PageNumberPagination):
             'previous': self.get_previous_link(),
             'results': data,
         })
+
+
+Cursor = namedtuple('Cursor', ['sent_at', 'message_id', 'reverse'])
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination over (sent_at, message_id), newest first.
+
+    Each page is a single indexed range scan: no COUNT query and no OFFSET,
+    and rows inserted while a client is paging never shift the window.
+    Clients that still send ?page=N are served by MessagePagination.
+    """
+    page_size = 20
+    cursor_query_param = 'cursor'
+    legacy_query_param = 'page'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.legacy = None
+        if self.legacy_query_param in request.query_params:
+            self.legacy = MessagePagination()
+            # OFFSET pages are only stable over a total order
+            queryset = queryset.order_by('-sent_at', '-message_id')
+            return self.legacy.paginate_queryset(queryset, request, view)
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        if self.cursor is not None:
+            if reverse:
+                queryset = queryset.filter(
+                    Q(sent_at__gt=self.cursor.sent_at) |
+                    Q(sent_at=self.cursor.sent_at, message_id__gt=self.cursor.message_id)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(sent_at__lt=self.cursor.sent_at) |
+                    Q(sent_at=self.cursor.sent_at, message_id__lt=self.cursor.message_id)
+                )
+
+        ordering = ('sent_at', 'message_id') if reverse else ('-sent_at', '-message_id')
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        # Walking backwards, "more" lies before the page; walking forwards, after it.
+        if reverse:
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        return self.encode_cursor(Cursor(last.sent_at, last.message_id, False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Paged past the end: step back to everything newer than the cursor.
+            return self.encode_cursor(
+                Cursor(self.cursor.sent_at, self.cursor.message_id, True)
+            )
+        first = self.page[0]
+        return self.encode_cursor(Cursor(first.sent_at, first.message_id, True))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            sent_at = parse_datetime(data['t'])
+            if sent_at is None:
+                raise ValueError
+            return Cursor(sent_at, uuid.UUID(data['id']), bool(data.get('r')))
+        except (TypeError, ValueError, KeyError, AttributeError, binascii.Error, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        data = {'t': cursor.sent_at.isoformat(), 'id': str(cursor.message_id)}
+        if cursor.reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode('ascii')).decode('ascii')
+        url = remove_query_param(self.base_url, self.legacy_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque cursor returned in the next/previous links.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.legacy_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Legacy page number; switches to page-number pagination.',
+                'schema': {'type': 'integer'},
+            },
+        ]
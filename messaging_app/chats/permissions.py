@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from .membership import is_participant
 
 
 class IsParticipantOfConversation(permissions.BasePermission):
@@ -13,14 +14,14 @@ class IsParticipantOfConversation(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # Ensure the user is a participant of the conversation for any request
-        if hasattr(obj, 'conversation'):
-            is_participant = request.user in obj.conversation.participants.all()
+        if hasattr(obj, 'conversation_id'):
+            participant = is_participant(request, obj.conversation_id)
         else:
             return False
 
         # Restrict write actions to participants only
         if request.method in ["PUT", "PATCH", "DELETE"]:
-            return is_participant
+            return participant
 
         # Allow GET, POST, etc. for participants too
-        return is_participant
+        return participant
@@ -0,0 +1,349 @@
+import asyncio
+import json
+import threading
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http.request import split_domain_port, validate_host
+from django.utils.http import is_same_domain
+from django.utils.module_loading import import_string
+
+WEBSOCKET_PATH = '/ws/messages/'
+SSE_PATH = '/api/messages/stream/'
+HEARTBEAT_SECONDS = 15
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+class BaseBroker:
+    """
+    Pub/sub transport between the code that saves messages and the
+    connections waiting for them. publish() is called from sync code (a
+    signal handler); subscribe() returns a Subscription with an async
+    get() and a close().
+    """
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    async def subscribe(self, channels):
+        raise NotImplementedError
+
+
+class LocalSubscription:
+
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message):
+        # Runs on the subscriber's loop; a stalled client loses its oldest messages
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    async def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker(BaseBroker):
+    """
+    In-process broker: fans messages out to subscribers of this process
+    only. Safe to publish from any thread.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+
+    async def subscribe(self, channels):
+        subscription = LocalSubscription(self, channels, self.maxsize)
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+
+class RedisSubscription:
+
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def get(self):
+        while True:
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            if message is not None:
+                return json.loads(message['data'])
+
+    async def close(self):
+        await self.pubsub.unsubscribe()
+        await self.pubsub.close()
+
+
+class RedisBroker(BaseBroker):
+    """
+    Redis pub/sub, shared by every pod. Takes a sync client for publish()
+    and an asyncio client for subscriptions; any clients exposing
+    redis-py's API work, e.g. fakeredis in tests.
+    """
+
+    def __init__(self, client=None, async_client=None):
+        url = getattr(settings, 'CHATS_PUSH_REDIS_URL', 'redis://localhost:6379/0')
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        if async_client is None:
+            import redis.asyncio
+            async_client = redis.asyncio.Redis.from_url(url)
+        self.client = client
+        self.async_client = async_client
+
+    def publish(self, channel, message):
+        self.client.publish(channel, json.dumps(message, cls=DjangoJSONEncoder))
+
+    async def subscribe(self, channels):
+        pubsub = self.async_client.pubsub()
+        await pubsub.subscribe(*channels)
+        # Wait for Redis to confirm, so nothing published from here on is missed
+        confirmed = 0
+        while confirmed < len(channels):
+            message = await pubsub.get_message(timeout=None)
+            if message is not None and message['type'] == 'subscribe':
+                confirmed += 1
+        return RedisSubscription(pubsub)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The broker named by settings.CHATS_PUSH_BROKER (LocalBroker by default)."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'CHATS_PUSH_BROKER', 'chats.push.LocalBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def publish_message(message, participant_ids):
+    """Push a saved chats.Message to every participant's channel."""
+    payload = {
+        'type': 'message',
+        'message_id': str(message.pk),
+        'conversation': str(message.conversation_id),
+        'seq': message.seq,
+        'sender': str(message.sender_id),
+        'message_body': message.message_body,
+        'sent_at': message.sent_at.isoformat(),
+    }
+    broker = get_broker()
+    for user_id in participant_ids:
+        broker.publish(user_channel(user_id), payload)
+
+
+def _query_token(scope):
+    return parse_qs(scope.get('query_string', b'').decode()).get('token')
+
+
+def _origin_allowed(scope):
+    """
+    Whether a connection's Origin is one of this site's: a host in
+    ALLOWED_HOSTS or an origin in CSRF_TRUSTED_ORIGINS, as
+    CsrfViewMiddleware accepts them. Browsers always send Origin on a
+    WebSocket handshake, so a missing one is not a cross-site page.
+    """
+    origin = dict(scope.get('headers', ())).get(b'origin')
+    if origin is None:
+        return True
+    origin = origin.decode('latin-1')
+    try:
+        parsed = urlsplit(origin)
+    except ValueError:
+        return False
+    if not parsed.netloc:  # e.g. 'null' from a sandboxed page
+        return False
+
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']
+    domain, _ = split_domain_port(parsed.netloc)
+    if domain and validate_host(domain, allowed_hosts):
+        return True
+
+    for trusted in settings.CSRF_TRUSTED_ORIGINS:
+        if origin == trusted:
+            return True
+        trusted = urlsplit(trusted)
+        if '*' in trusted.netloc and trusted.scheme == parsed.scheme and \
+                is_same_domain(parsed.netloc, trusted.netloc.lstrip('*')):
+            return True
+    return False
+
+
+def _authenticate(scope):
+    """
+    The user behind a connection: a simplejwt access token in ?token=
+    (browsers cannot set headers on a WebSocket), else the session cookie.
+    """
+    from django.contrib.auth import get_user
+    from django.contrib.auth.models import AnonymousUser
+
+    token = _query_token(scope)
+    if token:
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+        from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
+        from rest_framework.exceptions import AuthenticationFailed
+        auth = JWTAuthentication()
+        try:
+            return auth.get_user(auth.get_validated_token(token[0]))
+        except (TokenError, InvalidToken, AuthenticationFailed):
+            return AnonymousUser()
+
+    headers = dict(scope.get('headers', ()))
+    cookies = SimpleCookie(headers.get(b'cookie', b'').decode('latin-1'))
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return AnonymousUser()
+
+    from importlib import import_module
+    session_store = import_module(settings.SESSION_ENGINE).SessionStore
+
+    class SessionRequest:
+        session = session_store(morsel.value)
+
+    return get_user(SessionRequest())
+
+
+authenticate = sync_to_async(_authenticate)
+
+
+class PushRouter:
+    """
+    ASGI entry point: WebSocket and SSE connections on the push paths are
+    served here, everything else goes to the Django application.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'websocket' and scope['path'] == WEBSOCKET_PATH:
+            return await self.websocket(scope, receive, send)
+        if scope['type'] == 'http' and scope['path'] == SSE_PATH:
+            return await self.event_stream(scope, receive, send)
+        return await self.application(scope, receive, send)
+
+    async def websocket(self, scope, receive, send):
+        if (await receive())['type'] != 'websocket.connect':
+            return
+        # Browsers send cookies on cross-site WebSocket handshakes: a session
+        # login is only good from one of this site's own pages
+        if not _query_token(scope) and not _origin_allowed(scope):
+            await send({'type': 'websocket.close', 'code': 4403})
+            return
+        user = await authenticate(scope)
+        if not user.is_authenticated:
+            await send({'type': 'websocket.close', 'code': 4401})
+            return
+
+        async def accept():
+            await send({'type': 'websocket.accept'})
+
+        async def forward(message):
+            await send({'type': 'websocket.send', 'text': json.dumps(message, cls=DjangoJSONEncoder)})
+
+        async def until_disconnect():
+            while (await receive())['type'] != 'websocket.disconnect':
+                pass  # Push only; anything the client sends is ignored
+
+        await self._pump(user, accept, forward, until_disconnect())
+
+    async def event_stream(self, scope, receive, send):
+        user = await authenticate(scope)
+        if not user.is_authenticated:
+            await send({'type': 'http.response.start', 'status': 401,
+                        'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Authentication required.'})
+            return
+
+        async def accept():
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+
+        async def forward(message):
+            data = json.dumps(message, cls=DjangoJSONEncoder)
+            await send({'type': 'http.response.body',
+                        'body': f"event: {message['type']}\ndata: {data}\n\n".encode(),
+                        'more_body': True})
+
+        async def until_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        async def heartbeat():
+            # Comment lines keep proxies from timing out an idle stream
+            while True:
+                await asyncio.sleep(HEARTBEAT_SECONDS)
+                await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+
+        await self._pump(user, accept, forward, until_disconnect(), keepalive=heartbeat)
+
+    async def _pump(self, user, accept, forward, disconnected, keepalive=None):
+        # Subscribe before accepting so nothing sent in between is missed
+        subscription = await get_broker().subscribe([user_channel(user.pk)])
+        disconnect = asyncio.ensure_future(disconnected)
+        background = None
+        try:
+            await accept()
+            if keepalive is not None:
+                background = asyncio.ensure_future(keepalive())
+            while True:
+                next_message = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait(
+                    {next_message, disconnect}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnect in done:
+                    next_message.cancel()
+                    return
+                await forward(next_message.result())
+        finally:
+            disconnect.cancel()
+            if background is not None:
+                background.cancel()
+            await subscription.close()
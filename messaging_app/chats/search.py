@@ -0,0 +1,170 @@
+import uuid
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import Conversation, Message
+
+Participant = Conversation.participants.through
+
+FTS_TABLE = 'chats_message_fts'
+PG_INDEX_NAME = 'message_body_search_idx'
+
+
+def _config():
+    # Postgres text search configuration (stemming language)
+    return getattr(settings, 'CHATS_SEARCH_CONFIG', 'english')
+
+
+def _search_vector():
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector('message_body', config=_config())
+
+
+def create_search_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate hook: create the inverted index over message bodies.
+
+    SQLite gets an FTS5 table whose rowids mirror chats_message rowids,
+    filled from existing messages when first created. Postgres gets a GIN
+    index on the same to_tsvector() expression search_messages() filters
+    on, so the planner can use it.
+    """
+    connection = connections[using]
+    table = Message._meta.db_table
+    with connection.cursor() as cursor:
+        existing = connection.introspection.table_names(cursor)
+        if table not in existing:
+            return
+        if connection.vendor == 'sqlite':
+            if FTS_TABLE in existing:
+                return
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                f"message_body, conversation_id UNINDEXED, tokenize='porter unicode61')"
+            )
+            _fill_fts(cursor, table)
+        elif connection.vendor == 'postgresql':
+            if PG_INDEX_NAME in connection.introspection.get_constraints(cursor, table):
+                return
+            from django.contrib.postgres.indexes import GinIndex
+            with connection.schema_editor() as editor:
+                editor.add_index(Message, GinIndex(_search_vector(), name=PG_INDEX_NAME))
+
+
+def _fill_fts(cursor, table, where="", params=()):
+    cursor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, message_body, conversation_id) "
+        f"SELECT rowid, message_body, conversation_id FROM {table} {where}",
+        params,
+    )
+
+
+def rebuild_search_index(using=DEFAULT_DB_ALIAS):
+    """Re-read every message into the SQLite FTS table."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        _fill_fts(cursor, Message._meta.db_table)
+
+
+def _sqlite_rowid(table, pk_column):
+    return f"(SELECT rowid FROM {table} WHERE {pk_column} = %s)"
+
+
+def index_message(message, using=DEFAULT_DB_ALIAS, created=False):
+    """
+    Add or refresh one message in the SQLite FTS table; created skips
+    removing a previous entry a new message cannot have.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return  # Postgres indexes the column expression itself
+    table, pk_column = Message._meta.db_table, Message._meta.pk.column
+    pk = Message._meta.pk.get_db_prep_value(message.pk, connection)
+    with connection.cursor() as cursor:
+        if not created:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = {_sqlite_rowid(table, pk_column)}", [pk])
+        _fill_fts(cursor, table, f"WHERE {pk_column} = %s", [pk])
+
+
+def unindex_message(message, using=DEFAULT_DB_ALIAS):
+    """Drop one message from the SQLite FTS table; call before the row goes."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    table, pk_column = Message._meta.db_table, Message._meta.pk.column
+    pk = Message._meta.pk.get_db_prep_value(message.pk, connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = {_sqlite_rowid(table, pk_column)}", [pk])
+
+
+def _fts_query(text):
+    # Quote every term so user input can never be FTS5 query syntax
+    terms = ['"{}"'.format(term.replace('"', '""')) for term in text.split()]
+    return " ".join(terms)
+
+
+def search_messages(user, text, conversation_id=None, limit=20, using=DEFAULT_DB_ALIAS):
+    """
+    Messages matching text, best match first, from conversations user
+    participates in (optionally just conversation_id). Each result carries
+    `rank`, higher is better on both backends (SQLite's bm25 is negated).
+    """
+    connection = connections[using]
+    if not text.strip():
+        return []
+    if connection.vendor == 'postgresql':
+        return _search_postgres(user, text, conversation_id, limit, using)
+    return _search_sqlite(user, text, conversation_id, limit, connection)
+
+
+def _search_postgres(user, text, conversation_id, limit, using):
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+    query = SearchQuery(text, config=_config(), search_type='websearch')
+    vector = _search_vector()
+    messages = Message.objects.using(using).annotate(search=vector)\
+        .filter(search=query, conversation__participants=user)
+    if conversation_id is not None:
+        messages = messages.filter(conversation_id=conversation_id)
+    return list(
+        messages.annotate(rank=SearchRank(vector, query))
+        .select_related('sender').order_by('-rank')[:limit]
+    )
+
+
+def _search_sqlite(user, text, conversation_id, limit, connection):
+    message_table = Message._meta.db_table
+    participant_fk = Participant._meta.get_field('user')
+    conversation_fk = Message._meta.get_field('conversation')
+    sql = f"""
+        SELECT m.{Message._meta.pk.column}, -bm25({FTS_TABLE}) AS rank
+        FROM {FTS_TABLE} JOIN {message_table} m ON m.rowid = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s
+          AND {FTS_TABLE}.conversation_id IN (
+              SELECT {Participant._meta.get_field('conversation').column}
+              FROM {Participant._meta.db_table} WHERE {participant_fk.column} = %s
+          )
+    """
+    params = [_fts_query(text), participant_fk.get_db_prep_value(user.pk, connection)]
+    if conversation_id is not None:
+        sql += f" AND {FTS_TABLE}.conversation_id = %s"
+        params.append(conversation_fk.get_db_prep_value(conversation_id, connection))
+    sql += " ORDER BY rank DESC LIMIT %s"
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ranked = [(uuid.UUID(str(pk)), rank) for pk, rank in cursor.fetchall()]
+    found = Message.objects.using(connection.alias).select_related('sender')\
+        .in_bulk([pk for pk, _ in ranked])
+    results = []
+    for pk, rank in ranked:
+        message = found.get(pk)
+        if message is None:
+            continue  # Deleted since the FTS query
+        message.rank = rank
+        results.append(message)
+    return results
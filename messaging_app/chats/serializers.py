@@ -20,28 +20,66 @@ class MessageSerializer(serializers.ModelSerializer):
         model = Message
         fields = [
             'message_id', 'sender', 'sender_username',
-            'conversation', 'message_body', 'sent_at'
+            'conversation', 'message_body', 'sent_at', 'seq'
         ]
+        # Set in MessageViewSet.perform_create from the user and the nested route
+        extra_kwargs = {
+            'sender': {'read_only': True},
+            'conversation': {'required': False},
+        }
+        # seq is assigned in Message.save; the database enforces its uniqueness
+        validators = []
 
     def get_sender_username(self, obj):
         return obj.sender.username
 
 
+class LastMessageSerializer(serializers.ModelSerializer):
+    sender_username = serializers.CharField(source='sender.username', read_only=True)
+    preview = serializers.SerializerMethodField()
+
+    PREVIEW_LENGTH = 100
+
+    class Meta:
+        model = Message
+        fields = ['message_id', 'sender', 'sender_username', 'preview', 'sent_at']
+
+    def get_preview(self, obj):
+        return obj.message_body[:self.PREVIEW_LENGTH]
+
+
 class ConversationSerializer(serializers.ModelSerializer):
+    """
+    Summary of a conversation. Message history is served by the nested
+    conversations/{id}/messages/ route, never embedded here.
+    """
     participants = UserSerializer(many=True, read_only=True)
     participant_count = serializers.SerializerMethodField()
-    messages = MessageSerializer(many=True, read_only=True)
+    last_message = LastMessageSerializer(read_only=True)
+    last_activity_at = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Conversation
         fields = [
-            'conversation_id', 'participants',
-            'participant_count', 'messages', 'created_at'
+            'conversation_id', 'participants', 'participant_count', 'message_count',
+            'last_message', 'last_activity_at', 'unread_count', 'created_at'
         ]
 
     def get_participant_count(self, obj):
+        # Annotated by ConversationViewSet.get_queryset; fall back for bare instances
+        if hasattr(obj, 'participant_count'):
+            return obj.participant_count
         return obj.participants.count()
 
+    def get_last_activity_at(self, obj):
+        last_activity = obj.last_message_at or obj.created_at
+        return serializers.DateTimeField().to_representation(last_activity)
+
+    def get_unread_count(self, obj):
+        # Annotated by ConversationViewSet.get_queryset
+        return getattr(obj, 'unread_count', 0)
+
     def validate_participants(self, value):
         if len(value) < 1:
             raise serializers.ValidationError("A conversation must have at least one participant.")
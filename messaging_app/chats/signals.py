@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .models import Conversation, Message, MessageTombstone
+from . import membership, push, search
+
+
+@receiver(post_delete, sender=Message)
+def refresh_conversation_activity(sender, instance, **kwargs):
+    conversations = Conversation.objects.filter(pk=instance.conversation_id)
+    conversations.update(message_count=Greatest(F('message_count') - 1, 0))
+
+    # on_delete=SET_NULL has already cleared the pointer if it was this message
+    latest = Message.objects.filter(conversation_id=instance.conversation_id)\
+        .order_by('-sent_at', '-message_id').first()
+    conversations.filter(last_message__isnull=True).update(
+        last_message=latest,
+        last_message_at=latest.sent_at if latest else None,
+    )
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def invalidate_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        membership.invalidate([instance.pk])
+    elif pk_set is not None:
+        membership.invalidate(pk_set)
+    else:
+        # user.conversations.clear(): the ids are only known before the clear
+        membership.invalidate(instance.conversations.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Conversation)
+def forget_membership(sender, instance, **kwargs):
+    membership.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=Message)
+def index_message_body(sender, instance, created, update_fields=None, using=None, **kwargs):
+    if created or update_fields is None or {'message_body', 'conversation'} & set(update_fields):
+        search.index_message(instance, using=using, created=created)
+
+
+@receiver(pre_delete, sender=Message)
+def unindex_message_body(sender, instance, using=None, **kwargs):
+    # Before the delete: the FTS row is found through the message's rowid
+    search.unindex_message(instance, using=using)
+
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    if created:
+        def publish():
+            participants = Conversation.participants.through.objects\
+                .filter(conversation_id=instance.conversation_id).values_list('user_id', flat=True)
+            push.publish_message(instance, participants)
+        # The message is committed either way: a broker outage is logged,
+        # not turned into a failed request
+        transaction.on_commit(publish, robust=True)
+
+
+@receiver(post_delete, sender=Message)
+def record_message_deletion(sender, instance, **kwargs):
+    # Runs inside the delete's transaction, like the seq claimed by Message.save
+    seq = Conversation.objects.next_seq(instance.conversation_id)
+    if seq is not None:
+        MessageTombstone.objects.create(
+            conversation_id=instance.conversation_id, message_id=instance.pk, seq=seq
+        )
+
+
+@receiver(post_delete, sender=Conversation)
+def drop_tombstones(sender, instance, **kwargs):
+    MessageTombstone.objects.filter(conversation_id=instance.pk).delete()
@@ -0,0 +1,168 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    BigIntegerField, CharField, DateTimeField, F, Q, TextField, UUIDField, Value,
+)
+from django.utils import timezone
+
+from .models import Conversation, Message, MessageTombstone, SyncCursor, SyncState
+
+Participant = Conversation.participants.through
+
+# Same column order on both sides of the UNION
+CHANGE_COLUMNS = ('since_seq', 'kind', 'change_message', 'change_conversation', 'change_seq',
+                  'message_seq', 'change_sender', 'change_body', 'change_sent_at')
+
+
+def _token_ttl():
+    # Unused tokens older than this need a full resync
+    return timedelta(days=getattr(settings, 'CHATS_SYNC_TOKEN_TTL_DAYS', 30))
+
+
+def encode_token(state):
+    """Opaque sync token for a SyncState; '' before anything was synced."""
+    return str(state.pk) if state is not None else ''
+
+
+def decode_token(user, token):
+    """
+    The user's SyncState behind a token from encode_token, or None for an
+    empty one; raises ValueError if it is malformed, unknown or expired.
+    """
+    if not token:
+        return None
+    try:
+        return SyncState.objects.get(
+            pk=uuid.UUID(token), user_id=user.pk, created_at__gte=timezone.now() - _token_ttl()
+        )
+    except (ValueError, SyncState.DoesNotExist):
+        raise ValueError("Unknown or expired sync token.")
+
+
+def _after(queryset, state, seq_field):
+    """
+    queryset's rows past state's cursors, annotated with the cursor as
+    since_seq: a list of querysets to UNION ALL. Synced conversations are
+    an inner join on the state's SyncCursor rows, which drives one range
+    scan per conversation on the (conversation, seq) index however many
+    there are; conversations the client has never synced start from 0.
+    """
+    zero = Value(0, output_field=BigIntegerField())
+    if state is None:
+        return [queryset.annotate(since_seq=zero)]
+    synced = queryset.filter(**{
+        'conversation__sync_cursors__state': state,
+        f'{seq_field}__gt': F('conversation__sync_cursors__seq'),
+    }).annotate(since_seq=F('conversation__sync_cursors__seq'))
+    unsynced = queryset.exclude(conversation__in=state.cursors.values('conversation_id'))\
+        .annotate(since_seq=zero)
+    return [synced, unsynced]
+
+
+def _message_changes(messages):
+    return messages.annotate(
+        kind=Value('message', output_field=CharField()),
+        change_message=F('message_id'),
+        change_conversation=F('conversation_id'),
+        change_seq=F('changed_seq'),
+        message_seq=F('seq'),
+        change_sender=F('sender_id'),
+        change_body=F('message_body'),
+        change_sent_at=F('sent_at'),
+    ).values(*CHANGE_COLUMNS)
+
+
+def _deletion_changes(tombstones):
+    return tombstones.annotate(
+        kind=Value('deleted', output_field=CharField()),
+        change_message=F('message_id'),
+        change_conversation=F('conversation_id'),
+        change_seq=F('seq'),
+        message_seq=Value(None, output_field=BigIntegerField()),
+        change_sender=Value(None, output_field=UUIDField()),
+        change_body=Value(None, output_field=TextField()),
+        change_sent_at=Value(None, output_field=DateTimeField()),
+    ).values(*CHANGE_COLUMNS)
+
+
+def changes_since(user, state, limit=200):
+    """
+    Every change to user's conversations after the per-conversation
+    sequence numbers stored in state (None for a full sync), oldest first
+    within each conversation, as one UNION ALL query over messages and
+    tombstones.
+
+    Returns (changes, advanced, has_more): each change is a dict with
+    `type` 'new', 'edited' or 'deleted', and advanced maps each
+    conversation in changes to its last seq, ready for advance().
+    """
+    mine = Participant.objects.filter(user_id=user.pk).values('conversation_id')
+    parts = [
+        _message_changes(part)
+        for part in _after(Message.objects.filter(conversation__in=mine), state, 'changed_seq')
+    ] + [
+        _deletion_changes(part)
+        for part in _after(MessageTombstone.objects.filter(conversation__in=mine), state, 'seq')
+    ]
+
+    first, *rest = parts
+    rows = list(
+        first.union(*rest, all=True)
+        .order_by('change_conversation', 'change_seq')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    changes = []
+    for row in rows[:limit]:
+        change = {
+            'message_id': str(row['change_message']),
+            'conversation': str(row['change_conversation']),
+            'seq': row['change_seq'],
+        }
+        if row['kind'] == 'deleted':
+            change['type'] = 'deleted'
+        else:
+            change.update({
+                'type': 'new' if row['message_seq'] > row['since_seq'] else 'edited',
+                'message_seq': row['message_seq'],
+                'sender': str(row['change_sender']),
+                'message_body': row['change_body'],
+                'sent_at': row['change_sent_at'],
+            })
+        changes.append(change)
+    advanced = {change['conversation']: change['seq'] for change in changes}
+    return changes, advanced, has_more
+
+
+def advance(user, state, advanced):
+    """
+    The SyncState for state moved on to the seqs in advanced (from
+    changes_since); state itself if nothing changed.
+
+    The client presenting state shows it received it, so the state it
+    was advanced from is no longer needed for retries and is deleted,
+    along with the user's tokens that expired unused.
+    """
+    if not advanced:
+        return state
+    with transaction.atomic():
+        new_state = SyncState.objects.create(user_id=user.pk, parent=state)
+        cursors = {}
+        if state is not None:
+            # Conversations the user has left are not carried over
+            mine = Participant.objects.filter(user_id=user.pk).values('conversation_id')
+            cursors = dict(
+                state.cursors.filter(conversation__in=mine).values_list('conversation_id', 'seq')
+            )
+        cursors.update((uuid.UUID(conversation_id), seq) for conversation_id, seq in advanced.items())
+        SyncCursor.objects.bulk_create(
+            SyncCursor(state=new_state, conversation_id=conversation_id, seq=seq)
+            for conversation_id, seq in cursors.items()
+        )
+        stale = Q(created_at__lt=timezone.now() - _token_ttl())
+        if state is not None and state.parent_id is not None:
+            stale |= Q(pk=state.parent_id)
+        SyncState.objects.filter(stale, user_id=user.pk).delete()
+    return new_state
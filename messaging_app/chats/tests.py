@@ -1,7 +1,33 @@
+import asyncio
+import base64
+import json
+from datetime import timedelta
+from unittest import skipIf
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import User, Conversation, Message
+from .models import User, Conversation, Message, MessageTombstone, SyncCursor, SyncState
+from .membership import is_participant
+from .search import search_messages
+from .sync import changes_since
+from . import push
+from .push import SSE_PATH, WEBSOCKET_PATH, LocalBroker, PushRouter, RedisBroker
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
 
 class MessagingAppTests(APITestCase):
 
@@ -28,3 +54,672 @@ class MessagingAppTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Message.objects.count(), 1)
         self.assertEqual(Message.objects.first().message_body, "Hello world!")
+
+
+class MessageCursorPaginationTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='pager', password='testpass123', email='pager@example.com'
+        )
+        self.client.login(username='pager', password='testpass123')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.user)
+        for i in range(45):
+            Message.objects.create(
+                sender=self.user, conversation=self.conversation,
+                message_body=f"message {i}"
+            )
+        self.url = reverse(
+            'conversation-messages-list',
+            kwargs={'conversation_pk': str(self.conversation.conversation_id)}
+        )
+
+    def collect_pages(self, url, link):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(m['message_id'] for m in response.data['results'])
+            url = response.data[link]
+        return seen
+
+    def test_walks_every_message_once_newest_first(self):
+        seen = self.collect_pages(self.url, 'next')
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(len(set(seen)), 45)
+        expected = Message.objects.order_by('-sent_at', '-message_id')\
+            .values_list('message_id', flat=True)
+        self.assertEqual(seen, [str(pk) for pk in expected])
+
+    def test_previous_link_returns_to_first_page(self):
+        first = self.client.get(self.url).data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(first['previous'])
+
+    def test_inserts_do_not_shift_pages(self):
+        first = self.client.get(self.url).data
+        Message.objects.create(
+            sender=self.user, conversation=self.conversation, message_body="late"
+        )
+        second = self.client.get(first['next']).data
+        first_ids = {m['message_id'] for m in first['results']}
+        self.assertFalse(first_ids & {m['message_id'] for m in second['results']})
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        forged = base64.urlsafe_b64encode(json.dumps(
+            {'t': '2024-01-01T00:00:00+00:00', 'id': 'zzz'}
+        ).encode()).decode()
+        response = self.client.get(self.url, {'cursor': forged})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_malformed_conversation_id(self):
+        response = self.client.get('/api/conversations/not-a-uuid/messages/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_mode_still_available(self):
+        response = self.client.get(self.url, {'page': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 45)
+        self.assertEqual(response.data['current_page'], 2)
+        expected = Message.objects.order_by('-sent_at', '-message_id')\
+            .values_list('message_id', flat=True)[20:40]
+        self.assertEqual([m['message_id'] for m in response.data['results']],
+                         [str(pk) for pk in expected])
+
+
+class QueryCountTests(APITestCase):
+    """Guard against N+1 regressions: list cost must not grow with the data."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='counter', password='testpass123', email='counter@example.com'
+        )
+        self.client.login(username='counter', password='testpass123')
+        self.others = [
+            User.objects.create_user(
+                username=f'other{i}', password='testpass123', email=f'other{i}@example.com'
+            )
+            for i in range(3)
+        ]
+
+    def add_conversations(self, n):
+        for _ in range(n):
+            conversation = Conversation.objects.create()
+            conversation.participants.add(self.user, *self.others)
+            for sender in [self.user, *self.others]:
+                Message.objects.create(
+                    sender=sender, conversation=conversation, message_body="hi"
+                )
+        return conversation
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_conversation_list_query_count_is_constant(self):
+        url = reverse('conversations-list')
+        self.add_conversations(2)
+        small = self.count_queries(url)
+        self.add_conversations(8)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_message_list_query_count_is_constant(self):
+        conversation = self.add_conversations(1)
+        url = reverse(
+            'conversation-messages-list',
+            kwargs={'conversation_pk': str(conversation.conversation_id)}
+        )
+        self.client.get(url)  # first read creates the read marker
+        small = self.count_queries(url)
+        for sender in self.others * 4:
+            Message.objects.create(
+                sender=sender, conversation=conversation, message_body="more"
+            )
+        self.assertEqual(self.count_queries(url), small)
+
+
+class ConversationSummaryTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader', password='testpass123', email='reader@example.com'
+        )
+        self.friend = User.objects.create_user(
+            username='friend', password='testpass123', email='friend@example.com'
+        )
+        self.client.login(username='reader', password='testpass123')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.user, self.friend)
+        for body in ["first", "second", "third"]:
+            Message.objects.create(
+                sender=self.friend, conversation=self.conversation, message_body=body
+            )
+        Message.objects.create(
+            sender=self.user, conversation=self.conversation, message_body="reply"
+        )
+
+    def get_summary(self):
+        response = self.client.get(reverse('conversations-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results'][0]
+
+    def test_list_does_not_embed_history(self):
+        summary = self.get_summary()
+        self.assertNotIn('messages', summary)
+        self.assertEqual(summary['participant_count'], 2)
+        self.assertEqual(summary['last_message']['preview'], "reply")
+        self.assertEqual(summary['last_message']['sender_username'], "reader")
+        self.assertEqual(summary['last_activity_at'], summary['last_message']['sent_at'])
+
+    def test_other_peoples_conversations_are_hidden(self):
+        stranger = User.objects.create_user(
+            username='stranger', password='testpass123', email='stranger@example.com'
+        )
+        private = Conversation.objects.create()
+        private.participants.add(self.friend, stranger)
+        Message.objects.create(sender=stranger, conversation=private, message_body="secret")
+        response = self.client.get(reverse('conversations-list'))
+        self.assertEqual([c['conversation_id'] for c in response.data['results']],
+                         [str(self.conversation.conversation_id)])
+        response = self.client.get(reverse('conversations-detail', args=[private.conversation_id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unread_count_cleared_by_reading_messages(self):
+        self.assertEqual(self.get_summary()['unread_count'], 3)
+        self.client.get(reverse(
+            'conversation-messages-list',
+            kwargs={'conversation_pk': str(self.conversation.conversation_id)}
+        ))
+        self.assertEqual(self.get_summary()['unread_count'], 0)
+
+    def test_last_message_follows_deletes(self):
+        self.conversation.refresh_from_db()
+        self.conversation.last_message.delete()
+        self.assertEqual(self.get_summary()['last_message']['preview'], "third")
+
+
+class ConversationActivityTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='active', password='testpass123', email='active@example.com'
+        )
+        self.client.login(username='active', password='testpass123')
+
+    def test_counters_follow_creates_and_deletes(self):
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.user)
+        messages = [
+            Message.objects.create(
+                sender=self.user, conversation=conversation, message_body=str(i)
+            )
+            for i in range(3)
+        ]
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 3)
+        self.assertEqual(conversation.last_message, messages[-1])
+        self.assertEqual(conversation.last_message_at, messages[-1].sent_at)
+
+        messages[-1].delete()
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 2)
+        self.assertEqual(conversation.last_message, messages[1])
+        self.assertEqual(conversation.last_message_at, messages[1].sent_at)
+
+    def test_messages_cannot_move_between_conversations(self):
+        source, target = Conversation.objects.create(), Conversation.objects.create()
+        for conversation in (source, target):
+            conversation.participants.add(self.user)
+            # Both at seq 1, so a move would collide on (conversation, seq)
+            Message.objects.create(sender=self.user, conversation=conversation, message_body="hi")
+        message = source.messages.get()
+        url = reverse('conversation-messages-detail', kwargs={
+            'conversation_pk': str(source.pk), 'pk': str(message.pk),
+        })
+        response = self.client.patch(url, {'conversation': str(target.pk)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('conversation', response.data)
+        message.refresh_from_db()
+        self.assertEqual(message.conversation, source)
+
+        response = self.client.patch(url, {'message_body': "edited"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['conversation'], source.pk)
+
+    def test_create_writes_the_conversation_row_once(self):
+        conversation = Conversation.objects.create()
+        for returning in (True, False):
+            with patch('chats.models._can_update_returning', return_value=returning), \
+                    CaptureQueriesContext(connection) as ctx:
+                message = Message.objects.create(
+                    sender=self.user, conversation=conversation, message_body="hi"
+                )
+            statements = [q['sql'] for q in ctx.captured_queries]
+            updates = [sql for sql in statements if sql.startswith('UPDATE "chats_conversation"')]
+            self.assertEqual(len(updates), 1, statements)
+            # UPDATE (RETURNING or a SELECT after it), INSERT, and the FTS row
+            self.assertEqual(len(statements), 3 if returning else 4, statements)
+            conversation.refresh_from_db()
+            self.assertEqual(conversation.last_message, message)
+            self.assertEqual(conversation.last_message_at, message.sent_at)
+        self.assertEqual((conversation.message_count, conversation.last_seq), (2, 2))
+
+    def test_conversations_ordered_by_activity(self):
+        older, newer = Conversation.objects.create(), Conversation.objects.create()
+        for conversation in (older, newer):
+            conversation.participants.add(self.user)
+        Message.objects.create(sender=self.user, conversation=newer, message_body="a")
+        Message.objects.create(sender=self.user, conversation=older, message_body="b")
+        response = self.client.get(reverse('conversations-list'))
+        ids = [c['conversation_id'] for c in response.data['results']]
+        self.assertEqual(ids, [str(older.conversation_id), str(newer.conversation_id)])
+
+
+class MembershipTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='member', password='testpass123', email='member@example.com'
+        )
+        self.outsider = User.objects.create_user(
+            username='outsider', password='testpass123', email='outsider@example.com'
+        )
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.user)
+        self.url = reverse(
+            'conversation-messages-list',
+            kwargs={'conversation_pk': str(self.conversation.conversation_id)}
+        )
+
+    def request_for(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return request
+
+    def test_one_exists_query_memoized_per_request(self):
+        request = self.request_for(self.user)
+        with self.assertNumQueries(1):
+            self.assertTrue(is_participant(request, self.conversation.conversation_id))
+            self.assertTrue(is_participant(request, str(self.conversation.conversation_id)))
+        with self.assertNumQueries(1):
+            self.assertFalse(is_participant(self.request_for(self.outsider),
+                                            self.conversation.conversation_id))
+
+    @override_settings(CHATS_MEMBERSHIP_CACHE_TTL=30)
+    def test_shared_cache_invalidated_on_participant_changes(self):
+        cache.clear()
+        conversation_id = self.conversation.conversation_id
+        self.assertFalse(is_participant(self.request_for(self.outsider), conversation_id))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_participant(self.request_for(self.user), conversation_id))
+
+        self.conversation.participants.add(self.outsider)
+        self.assertTrue(is_participant(self.request_for(self.outsider), conversation_id))
+        self.outsider.conversations.remove(self.conversation)
+        self.assertFalse(is_participant(self.request_for(self.outsider), conversation_id))
+
+    def test_only_participants_can_post(self):
+        self.client.login(username='outsider', password='testpass123')
+        response = self.client.post(self.url, {'message_body': "hi"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.login(username='member', password='testpass123')
+        response = self.client.post(self.url, {'message_body': "hi"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Message.objects.get().conversation, self.conversation)
+
+    def test_updates_cannot_target_a_foreign_conversation(self):
+        message = Message.objects.create(
+            sender=self.user, conversation=self.conversation, message_body="hi"
+        )
+        foreign = Conversation.objects.create()
+        foreign.participants.add(self.outsider)
+        self.client.login(username='member', password='testpass123')
+        url = reverse('conversation-messages-detail', kwargs={
+            'conversation_pk': str(self.conversation.conversation_id), 'pk': str(message.pk),
+        })
+        response = self.client.patch(url, {'conversation': str(foreign.pk)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        message.refresh_from_db()
+        self.assertEqual(message.conversation, self.conversation)
+
+
+class MessageSearchTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='seeker', password='testpass123', email='seeker@example.com'
+        )
+        self.client.login(username='seeker', password='testpass123')
+        self.mine = Conversation.objects.create()
+        self.mine.participants.add(self.user)
+        self.theirs = Conversation.objects.create()
+        self.say(self.mine, "Lunch at the usual place?")
+        self.say(self.mine, "Running late, lunch lunch lunch")
+        self.say(self.theirs, "Private lunch plans")
+
+    def say(self, conversation, body):
+        return Message.objects.create(sender=self.user, conversation=conversation, message_body=body)
+
+    def bodies(self, text, **kwargs):
+        return [m.message_body for m in search_messages(self.user, text, **kwargs)]
+
+    def test_ranked_and_limited_to_own_conversations(self):
+        self.assertEqual(self.bodies("lunch"), [
+            "Running late, lunch lunch lunch", "Lunch at the usual place?",
+        ])
+        self.assertEqual(self.bodies("run"), ["Running late, lunch lunch lunch"])
+        self.assertEqual(self.bodies('usual" OR "private'), [])
+        ranks = [m.rank for m in search_messages(self.user, "lunch")]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        self.assertGreater(ranks[0], ranks[1])
+
+    def test_message_deleted_mid_search_is_skipped(self):
+        doomed = self.say(self.mine, "lunch is cancelled")
+        in_bulk = QuerySet.in_bulk
+
+        def delete_first(queryset, *args, **kwargs):
+            Message.objects.filter(pk=doomed.pk).delete()
+            return in_bulk(queryset, *args, **kwargs)
+
+        with patch.object(QuerySet, 'in_bulk', delete_first):
+            results = search_messages(self.user, "lunch")
+        self.assertEqual(len(results), 2)
+        self.assertNotIn(doomed, results)
+
+    def test_index_follows_edits_and_deletes(self):
+        message = self.say(self.mine, "dinner tonight")
+        message.message_body = "breakfast tomorrow"
+        message.save()
+        self.assertEqual(self.bodies("dinner"), [])
+        self.assertEqual(self.bodies("breakfast"), ["breakfast tomorrow"])
+        message.delete()
+        self.assertEqual(self.bodies("breakfast"), [])
+
+    def test_endpoint(self):
+        url = reverse('message-search')
+        response = self.client.get(url, {'q': 'lunch', 'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIn('rank', response.data['results'][0])
+
+        response = self.client.get(url, {'q': 'lunch', 'conversation': str(self.theirs.conversation_id)})
+        self.assertEqual(response.data['results'], [])
+        response = self.client.get(url, {'q': 'lunch', 'conversation': 'nope'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PushTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='listener', password='testpass123', email='listener@example.com'
+        )
+        self.client.login(username='listener', password='testpass123')
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.user)
+        self.app = PushRouter(application=None)
+
+    def send_message(self, body):
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(sender=self.user, conversation=self.conversation, message_body=body)
+
+    def connect(self, scope):
+        inbox, outbox = asyncio.Queue(), asyncio.Queue()
+        task = asyncio.ensure_future(self.app(scope, inbox.get, outbox.put))
+        return task, inbox, lambda: asyncio.wait_for(outbox.get(), 5)
+
+    def test_broker_outage_does_not_fail_the_post(self):
+        url = reverse('conversation-messages-list',
+                      kwargs={'conversation_pk': str(self.conversation.conversation_id)})
+        with patch.object(push, 'publish_message', side_effect=ConnectionError("down")), \
+                self.assertLogs('django', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'message_body': "hi"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Message.objects.filter(message_body="hi").exists())
+
+    async def test_local_broker_fans_out_across_threads(self):
+        broker = LocalBroker()
+        first, second = await broker.subscribe(['a']), await broker.subscribe(['a', 'b'])
+        await sync_to_async(broker.publish, thread_sensitive=False)('a', {'n': 1})
+        self.assertEqual(await asyncio.wait_for(first.get(), 5), {'n': 1})
+        self.assertEqual(await asyncio.wait_for(second.get(), 5), {'n': 1})
+        await first.close()
+        broker.publish('a', {'n': 2})
+        self.assertEqual(await asyncio.wait_for(second.get(), 5), {'n': 2})
+        self.assertEqual(first.queue.qsize(), 0)
+
+    @skipIf(fakeredis is None, "fakeredis is not installed")
+    async def test_redis_broker(self):
+        server = fakeredis.FakeServer()
+        broker = RedisBroker(fakeredis.FakeRedis(server=server),
+                             fakeredis.FakeAsyncRedis(server=server))
+        subscription = await broker.subscribe(['a', 'b'])
+        # Subscribed on return: a publish straight away is delivered
+        broker.publish('b', {'n': 1})
+        self.assertEqual(await asyncio.wait_for(subscription.get(), 5), {'n': 1})
+        await subscription.close()
+        self.assertEqual(broker.client.publish('a', '{}'), 0)
+
+    @skipIf(fakeredis is None, "fakeredis is not installed")
+    async def test_websocket_over_redis_broker(self):
+        server = fakeredis.FakeServer()
+        broker = RedisBroker(fakeredis.FakeRedis(server=server),
+                             fakeredis.FakeAsyncRedis(server=server))
+        with patch.object(push, '_broker', broker):
+            task, inbox, received = self.connect({
+                'type': 'websocket', 'path': WEBSOCKET_PATH,
+                'headers': [(b'cookie', self.cookie.encode())],
+            })
+            await inbox.put({'type': 'websocket.connect'})
+            self.assertEqual((await received())['type'], 'websocket.accept')
+            await sync_to_async(self.send_message)("first")
+            self.assertEqual(json.loads((await received())['text'])['message_body'], "first")
+            await inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+            await asyncio.wait_for(task, 5)
+
+    async def test_websocket_pushes_new_messages(self):
+        task, inbox, received = self.connect({
+            'type': 'websocket', 'path': WEBSOCKET_PATH,
+            'headers': [(b'cookie', self.cookie.encode())],
+        })
+        await inbox.put({'type': 'websocket.connect'})
+        self.assertEqual((await received())['type'], 'websocket.accept')
+
+        await sync_to_async(self.send_message)("pushed")
+        event = await received()
+        self.assertEqual(event['type'], 'websocket.send')
+        payload = json.loads(event['text'])
+        self.assertEqual(payload['message_body'], "pushed")
+        self.assertEqual(payload['conversation'], str(self.conversation.conversation_id))
+
+        await inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(task, 5)
+
+    async def handshake(self, origin, query_string=b''):
+        task, inbox, received = self.connect({
+            'type': 'websocket', 'path': WEBSOCKET_PATH, 'query_string': query_string,
+            'headers': [(b'cookie', self.cookie.encode()), (b'origin', origin)],
+        })
+        await inbox.put({'type': 'websocket.connect'})
+        reply = await received()
+        if reply['type'] == 'websocket.accept':
+            await inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(task, 5)
+        return reply
+
+    async def test_websocket_rejects_foreign_origins(self):
+        rejected = {'type': 'websocket.close', 'code': 4403}
+        self.assertEqual(await self.handshake(b'https://evil.example'), rejected)
+        self.assertEqual(await self.handshake(b'null'), rejected)
+        self.assertEqual((await self.handshake(b'http://testserver'))['type'], 'websocket.accept')
+        with self.settings(CSRF_TRUSTED_ORIGINS=['https://*.chat.example']):
+            reply = await self.handshake(b'https://app.chat.example')
+            self.assertEqual(reply['type'], 'websocket.accept')
+            self.assertEqual(await self.handshake(b'http://app.chat.example'), rejected)
+
+        # A token is never sent by the browser on its own, so any page may use one
+        from rest_framework_simplejwt.tokens import AccessToken
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+        reply = await self.handshake(b'https://evil.example', f'token={token}'.encode())
+        self.assertEqual(reply['type'], 'websocket.accept')
+
+    async def test_websocket_rejects_anonymous(self):
+        task, inbox, received = self.connect({'type': 'websocket', 'path': WEBSOCKET_PATH})
+        await inbox.put({'type': 'websocket.connect'})
+        self.assertEqual(await received(), {'type': 'websocket.close', 'code': 4401})
+        await asyncio.wait_for(task, 5)
+
+    async def test_event_stream_fallback(self):
+        task, inbox, received = self.connect({
+            'type': 'http', 'path': SSE_PATH, 'method': 'GET',
+            'headers': [(b'cookie', self.cookie.encode())],
+        })
+        start = await received()
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+
+        await sync_to_async(self.send_message)("streamed")
+        body = (await received())['body'].decode()
+        self.assertTrue(body.startswith("event: message\ndata: "))
+        self.assertEqual(json.loads(body.split("data: ", 1)[1])['message_body'], "streamed")
+
+        await inbox.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(task, 5)
+
+
+class DeltaSyncTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='syncer', password='testpass123', email='syncer@example.com'
+        )
+        self.client.login(username='syncer', password='testpass123')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.user)
+        self.other = Conversation.objects.create()
+        self.url = reverse('conversations-sync')
+
+    def say(self, body, conversation=None):
+        return Message.objects.create(
+            sender=self.user, conversation=conversation or self.conversation, message_body=body
+        )
+
+    def sync(self, since=None, **params):
+        if since:
+            params['since'] = since
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_sequence_numbers_are_consecutive_per_conversation(self):
+        first, second = self.say("a"), self.say("b")
+        elsewhere = self.say("c", self.other)
+        self.assertEqual((first.seq, second.seq, elsewhere.seq), (1, 2, 1))
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_seq, 2)
+
+    def test_deltas_after_token(self):
+        kept, edited, deleted = self.say("kept"), self.say("edit me"), self.say("delete me")
+        self.say("not mine", self.other)
+        full = self.sync()
+        self.assertEqual([c['type'] for c in full['changes']], ['new', 'new', 'new'])
+        self.assertFalse(full['has_more'])
+
+        edited.message_body = "edited"
+        edited.save()
+        deleted_id = deleted.pk
+        deleted.delete()
+        added = self.say("added")
+        delta = self.sync(full['since'])
+        self.assertEqual(
+            [(c['type'], c['message_id']) for c in delta['changes']],
+            [('edited', str(edited.pk)), ('deleted', str(deleted_id)), ('new', str(added.pk))],
+        )
+        self.assertEqual(delta['changes'][0]['message_body'], "edited")
+        self.assertEqual(self.sync(delta['since'])['changes'], [])
+        self.assertNotIn(str(kept.pk), [c['message_id'] for c in delta['changes']])
+
+    def test_single_query_and_paging(self):
+        for i in range(5):
+            self.say(str(i))
+        with self.assertNumQueries(1):
+            changes, advanced, has_more = changes_since(self.user, None, limit=3)
+        self.assertEqual(len(changes), 3)
+        self.assertTrue(has_more)
+        rest = self.sync(self.sync(limit=3)['since'])
+        self.assertEqual([c['message_body'] for c in rest['changes']], ['3', '4'])
+
+    def test_conversation_delete_drops_tombstones(self):
+        self.say("gone")
+        self.conversation.delete()
+        self.assertFalse(MessageTombstone.objects.exists())
+
+    def test_invalid_token(self):
+        response = self.client.get(self.url, {'since': 'garbage!'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.say("a")
+        token = self.sync()['since']
+        SyncState.objects.update(created_at=timezone.now() - timedelta(days=31))
+        response = self.client.get(self.url, {'since': token})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tokens_can_be_retried_until_the_next_one_is_used(self):
+        self.say("a")
+        first = self.sync()['since']
+        self.say("b")
+        second = self.sync(first)
+        retried = self.sync(first)
+        self.assertEqual(retried['changes'], second['changes'])
+        self.say("c")
+        self.sync(second['since'])
+        # Using the second token shows the first one's response arrived
+        response = self.client.get(self.url, {'since': first})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # Nothing new: the token stays the same and nothing is stored
+        count = SyncState.objects.count()
+        latest = self.sync(self.sync(second['since'])['since'])
+        self.assertEqual(latest['changes'], [])
+        self.assertEqual(SyncState.objects.count(), count + 1)
+
+    def test_many_conversations(self):
+        conversations = Conversation.objects.bulk_create(Conversation() for _ in range(1200))
+        self.user.conversations.add(*conversations)
+        for conversation in conversations:
+            self.say("hi", conversation)
+        token, synced = None, []
+        while True:
+            page = self.sync(token, limit=500)
+            synced += page['changes']
+            token = page['since']
+            if not page['has_more']:
+                break
+        self.assertEqual(len(synced), 1200)
+        self.assertEqual(len(token), 36)
+
+        edited = Message.objects.get(conversation=conversations[700])
+        edited.message_body = "edited"
+        edited.save()
+        self.say("new", conversations[5])
+        with CaptureQueriesContext(connection) as ctx:
+            delta = self.sync(token)
+        self.assertEqual(
+            [(c['type'], c['message_body']) for c in delta['changes']],
+            [('new', "new"), ('edited', "edited")]
+            if str(conversations[5].pk) < str(conversations[700].pk)
+            else [('edited', "edited"), ('new', "new")],
+        )
+        # The cursors are joined in, not spelled out in the SQL
+        [query] = [q['sql'] for q in ctx.captured_queries if 'UNION ALL' in q['sql']]
+        self.assertLess(len(query), 5000)
+        self.assertEqual(SyncCursor.objects.filter(state_id=delta['since']).count(), 1200)
@@ -1,9 +1,10 @@
 from django.urls import path, include
+from rest_framework.routers import DefaultRouter
 from rest_framework_nested.routers import NestedDefaultRouter
-from .views import ConversationViewSet, MessageViewSet
+from .views import ConversationViewSet, MessageSearchView, MessageViewSet
 
 # Top-level router for conversations
-router = NestedDefaultRouter()
+router = DefaultRouter()
 router.register(r'conversations', ConversationViewSet, basename='conversations')
 
 # Nested router for messages within a conversation
@@ -11,6 +12,7 @@ convo_router = NestedDefaultRouter(router, r'conversations', lookup='conversatio
 convo_router.register(r'messages', MessageViewSet, basename='conversation-messages')
 
 urlpatterns = [
+    path('messages/search/', MessageSearchView.as_view(), name='message-search'),
     path('', include(router.urls)),
     path('', include(convo_router.urls)),
 ]
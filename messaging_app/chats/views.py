@@ -1,11 +1,23 @@
+import uuid
+
 from rest_framework import viewsets, permissions, status, filters
+from rest_framework.decorators import action
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .models import Conversation, Message
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django_filters.rest_framework import DjangoFilterBackend
+from .models import Conversation, ConversationReadState, Message
 from .serializers import ConversationSerializer, MessageSerializer
 from .permissions import IsParticipantOfConversation
-from .pagination import MessagePagination
+from .membership import is_participant
+from .search import search_messages
+from .sync import advance, changes_since, decode_token, encode_token
+from .pagination import MessageCursorPagination
 from .filters import MessageFilter
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 
 class ConversationViewSet(viewsets.ModelViewSet):
     queryset = Conversation.objects.all()
@@ -14,6 +26,55 @@ class ConversationViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter]
     search_fields = ['participants__username']
 
+    def get_queryset(self):
+        """
+        The user's conversations, with everything ConversationSerializer
+        reads loaded up front so a list request costs a fixed number of
+        queries regardless of its size.
+        """
+        user = self.request.user
+        # A subquery rather than a join, which would narrow participant_count
+        mine = Conversation.participants.through.objects.filter(user_id=user.pk)\
+            .values('conversation_id')
+        last_read_at = ConversationReadState.objects.filter(
+            conversation=OuterRef('pk'), user=user
+        ).values('last_read_at')[:1]
+        unread = Message.objects.filter(
+            conversation=OuterRef('pk'), sent_at__gt=OuterRef('last_read_at')
+        ).exclude(sender=user).order_by().values('conversation')\
+            .annotate(total=Count('*')).values('total')
+
+        return Conversation.objects.filter(pk__in=mine).annotate(
+            participant_count=Count('participants', distinct=True),
+            last_read_at=Coalesce(Subquery(last_read_at), 'created_at'),
+        ).annotate(
+            unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)),
+        ).select_related('last_message__sender').prefetch_related('participants')\
+            .order_by(F('last_message_at').desc(nulls_last=True), '-created_at')
+
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """
+        Delta sync: new, edited and deleted messages across all of the
+        user's conversations since the ?since= token from the previous
+        call (omit it for a full sync). Keep calling with the returned
+        token while has_more is true.
+        """
+        try:
+            state = decode_token(request.user, request.query_params.get('since'))
+        except ValueError:
+            raise ValidationError({'since': "Invalid or expired sync token; sync again without it."})
+        try:
+            limit = min(int(request.query_params.get('limit', 200)), 1000)
+        except ValueError:
+            limit = 200
+        changes, advanced, has_more = changes_since(request.user, state, max(limit, 1))
+        return Response({
+            'changes': changes,
+            'since': encode_token(advance(request.user, state, advanced)),
+            'has_more': has_more,
+        })
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -28,28 +89,101 @@ class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated, IsParticipantOfConversation]
-    pagination_class = MessagePagination
+    pagination_class = MessageCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = MessageFilter
 
+    def get_conversation_pk(self):
+        """The nested route's conversation id as a UUID, or None on the flat route."""
+        conversation_pk = self.kwargs.get('conversation_pk')
+        if not conversation_pk:
+            return None
+        try:
+            return uuid.UUID(str(conversation_pk))
+        except ValueError:
+            raise NotFound("Conversation not found.")
+
     def perform_create(self, serializer):
-        conversation_id = self.request.data.get('conversation_id')
+        conversation = serializer.validated_data.get('conversation')
+        conversation_id = self.get_conversation_pk() or getattr(conversation, 'pk', None)
         if not conversation_id:
-            raise PermissionDenied("conversation_id is required.")
+            raise PermissionDenied("conversation is required.")
+        if conversation is not None and str(conversation.pk) != str(conversation_id):
+            raise PermissionDenied("Message does not belong to this conversation.")
 
-        try:
-            conversation = Conversation.objects.get(id=conversation_id)
-        except Conversation.DoesNotExist:
-            raise PermissionDenied("Conversation does not exist.")
+        if not is_participant(self.request, conversation_id):
+            raise PermissionDenied("You are not a participant of this conversation.")
 
-        if self.request.user not in conversation.participants.all():
-            return Response({"detail": "Forbidden"},
-                            status=status.HTTP_403_FORBIDDEN)
+        if conversation is None:
+            serializer.save(sender=self.request.user, conversation_id=conversation_id)
+        else:
+            serializer.save(sender=self.request.user)
 
-        serializer.save(sender=self.request.user, conversation=conversation)
+    def perform_update(self, serializer):
+        conversation = serializer.validated_data.get('conversation', serializer.instance.conversation)
+        if not is_participant(self.request, conversation.pk):
+            raise PermissionDenied("You are not a participant of this conversation.")
+        # seq, the tombstone and both conversations' counters assume a
+        # message stays where it was posted
+        if conversation.pk != serializer.instance.conversation_id:
+            raise ValidationError({'conversation': "Messages cannot be moved to another conversation."})
+        serializer.save()
 
     def get_queryset(self):
         """
-        Return only messages from conversations the user participates in.
+        Return only messages from conversations the user participates in,
+        narrowed to one conversation on the nested route.
         """
-        return Message.objects.filter(conversation__participants=self.request.user)
+        queryset = Message.objects.filter(conversation__participants=self.request.user)\
+            .select_related('sender')
+        conversation_pk = self.get_conversation_pk()
+        if conversation_pk:
+            queryset = queryset.filter(conversation_id=conversation_pk)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        conversation_pk = self.get_conversation_pk()
+        # Opening the newest page of a conversation marks it as read
+        if conversation_pk and response.status_code == status.HTTP_200_OK \
+                and 'cursor' not in request.query_params \
+                and is_participant(request, conversation_pk):
+            now = timezone.now()
+            marked = ConversationReadState.objects.filter(
+                user=request.user, conversation_id=conversation_pk
+            ).update(last_read_at=now)
+            if not marked:
+                ConversationReadState.objects.get_or_create(
+                    user=request.user, conversation_id=conversation_pk,
+                    defaults={'last_read_at': now},
+                )
+        return response
+
+
+class MessageSearchView(APIView):
+    """
+    Full-text search over message bodies, best match first, limited to
+    conversations the user participates in. ?q= is required; ?conversation=
+    narrows to one conversation and ?limit= caps the results. Each result
+    carries a backend-specific `rank` where higher is better.
+    """
+    permission_classes = [IsAuthenticated]
+    MAX_LIMIT = 100
+
+    def get(self, request):
+        text = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.MAX_LIMIT)
+        except ValueError:
+            limit = 20
+        conversation_id = request.query_params.get('conversation')
+        if conversation_id:
+            try:
+                conversation_id = uuid.UUID(conversation_id)
+            except ValueError:
+                raise ValidationError({'conversation': "Must be a valid UUID."})
+        messages = search_messages(request.user, text, conversation_id or None, max(limit, 1))
+        serializer = MessageSerializer(messages, many=True)
+        for data, message in zip(serializer.data, messages):
+            data['rank'] = message.rank
+        return Response({'results': serializer.data})
@@ -1 +1,19 @@
+"""
+ASGI config for messaging_app project.
 
+Serves the Django application plus real-time message push: WebSocket
+connections on chats.push.WEBSOCKET_PATH and a Server-Sent Events
+fallback on chats.push.SSE_PATH.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'messaging_app.settings')
+
+django_application = get_asgi_application()
+
+from chats.push import PushRouter  # noqa: E402  (needs the app registry ready)
+
+application = PushRouter(django_application)
@@ -30,12 +30,6 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-
-
-    'chats.middleware.RequestLoggingMiddleware',
-    'chats.middleware.RestrictAccessByTimeMiddleware',
-    'chats.middleware.OffensiveLanguageMiddleware',
-    'chats.middleware.RolepermissionMiddleware',
 ]
 
 ROOT_URLCONF = 'messaging_app.urls'
@@ -94,4 +88,9 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# chats.User's primary key is user_id, not id
+SIMPLE_JWT = {
+    'USER_ID_FIELD': 'user_id',
+}
+
 CORS_ALLOW_ALL_ORIGINS = True